@@ -0,0 +1,139 @@
+# 失败告警聚合：按 (仓库, 步骤, 错误签名) 去重，按 topic 限流，重复次数合并到一条摘要中
+#
+# 状态保存在 Runner 主机的 SQLite 中，同一 Runner 上的并发流水线共享去重窗口与限流配额。
+
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from cache import cache_dir
+from messenger import DEFAULT_TOPIC, send_ntfy
+from pipeline import current_step
+
+
+_VOLATILE = [
+    (re.compile(r"\b[0-9a-f]{7,64}\b"), "<hash>"),  # 提交号、哈希
+    (re.compile(r"/tmp/\S+"), "<tmp>"),
+    (re.compile(r"\d+(\.\d+)?"), "<n>"),           # 时间、耗时、行号、端口
+]
+
+
+def error_signature(text: str) -> str:
+    """提取错误签名：首行 + 最后 3 个非空行，去掉哈希/数字等易变部分后取哈希"""
+    lines = [l.strip() for l in text.splitlines() if l.strip()]
+    key_lines = lines[:1] + lines[-3:]
+    normalized = "\n".join(key_lines).lower()
+    for pattern, repl in _VOLATILE:
+        normalized = pattern.sub(repl, normalized)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def _connect():
+    conn = sqlite3.connect(os.path.join(cache_dir("alerts"), "alerts.sqlite"), timeout=10, isolation_level=None)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS alerts ("
+        " key TEXT PRIMARY KEY, topic TEXT, title TEXT, last_sent REAL, suppressed INTEGER DEFAULT 0,"
+        " last_message TEXT)"
+    )
+    try:
+        # 旧版本建的表没有 last_message 列
+        conn.execute("ALTER TABLE alerts ADD COLUMN last_message TEXT")
+    except sqlite3.OperationalError:
+        pass
+    conn.execute("CREATE TABLE IF NOT EXISTS sends (topic TEXT, ts REAL)")
+    return conn
+
+
+def _settings():
+    return (
+        float(os.getenv("CI_ALERT_DEDUPE_SECONDS", "600")),   # 同类告警去重窗口
+        int(os.getenv("CI_ALERT_RATE_LIMIT", "5")),            # 每个 topic 每分钟最多发送条数
+    )
+
+
+def _excerpt(message: str, limit: int = 1500) -> str:
+    """被合并告警的留存内容：过长时保留开头与结尾（错误首行与最后的堆栈/输出）"""
+    if len(message) <= limit:
+        return message
+    half = limit // 2
+    return f"{message[:half].rstrip()}\n…\n{message[-half:].lstrip()}"
+
+
+def send_alert(message: str, title: str, step: str = None, repo: str = None,
+               priority: str = "high", tags: str = None) -> bool:
+    """发送失败告警（经过去重与限流），返回是否真正发出"""
+    repo = repo or os.getenv("GITEA_REPO") or "local"
+    step = step or current_step() or "-"
+    topic = os.getenv("NTFY_TOPIC") or DEFAULT_TOPIC
+    key = f"{repo}|{step}|{error_signature(message)}"
+    window, rate_limit = _settings()
+    now = time.time()
+
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            repeats = _record_alert(conn, key, topic, title, message, now, window, rate_limit)
+    except sqlite3.Error as e:
+        print(f"⚠️ 告警状态库不可用，直接发送: {e}")
+        repeats = 0
+    if repeats is None:
+        print(f"🔕 告警已合并（去重窗口内或 topic 限流）: [{repo}/{step}] {title}")
+        return False
+
+    if repeats:
+        message += f"\n\n（此前同类告警另出现 {repeats} 次，已合并）"
+    send_ntfy(message, title=f"[{repo}/{step}] {title}", priority=priority, tags=tags)
+    return True
+
+
+def _record_alert(conn, key: str, topic: str, title: str, message: str, now: float, window: float, rate_limit: int):
+    """在事务内判定是否发送：应合并时累加次数、留存最近一次内容并返回 None，否则登记发送并返回此前被合并的次数"""
+    row = conn.execute("SELECT last_sent, suppressed FROM alerts WHERE key = ?", (key,)).fetchone()
+    recent = conn.execute("SELECT COUNT(*) FROM sends WHERE topic = ? AND ts > ?", (topic, now - 60)).fetchone()[0]
+
+    if (row and row[0] and now - row[0] < window) or recent >= rate_limit:
+        conn.execute(
+            "INSERT INTO alerts (key, topic, title, last_sent, suppressed, last_message) VALUES (?, ?, ?, NULL, 1, ?) "
+            "ON CONFLICT(key) DO UPDATE SET suppressed = suppressed + 1, last_message = excluded.last_message",
+            (key, topic, title, _excerpt(message)),
+        )
+        return None
+
+    repeats = row[1] if row else 0
+    conn.execute(
+        "INSERT INTO alerts (key, topic, title, last_sent, suppressed, last_message) VALUES (?, ?, ?, ?, 0, NULL) "
+        "ON CONFLICT(key) DO UPDATE SET last_sent = excluded.last_sent, suppressed = 0, last_message = NULL",
+        (key, topic, title, now),
+    )
+    conn.execute("INSERT INTO sends (topic, ts) VALUES (?, ?)", (topic, now))
+    conn.execute("DELETE FROM sends WHERE ts < ?", (now - 3600,))
+    return repeats
+
+
+def flush_alert_summaries():
+    """对去重窗口已过、仍有被合并次数的告警补发一条摘要（流水线结束时调用）"""
+    window, _ = _settings()
+    now = time.time()
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            due = conn.execute(
+                "SELECT key, title, suppressed, last_message FROM alerts WHERE suppressed > 0 AND (last_sent IS NULL OR last_sent < ?)",
+                (now - window,),
+            ).fetchall()
+            for key, *_ in due:
+                conn.execute("UPDATE alerts SET suppressed = 0, last_sent = ?, last_message = NULL WHERE key = ?", (now, key))
+    except sqlite3.Error as e:
+        print(f"⚠️ 告警汇总失败（忽略）: {e}")
+        return
+
+    for key, title, suppressed, last_message in due:
+        repo, step, _ = key.split("|", 2)
+        detail = f"\n\n最近一次内容:\n{last_message}" if last_message else ""
+        send_ntfy(
+            f"过去 {window / 60:.0f} 分钟内同类告警共被合并 {suppressed} 次。{detail}",
+            title=f"[{repo}/{step}] {title}（汇总）",
+            priority="default",
+        )
@@ -0,0 +1,56 @@
+# Release 附件内容索引：按 sha256 记录已上传过的附件，相同内容再次发布时改为链接到已有附件
+#
+# 索引保存在 Runner 主机的 SQLite 中（按仓库区分）；命中后仍需向 Gitea 确认附件未被删除。
+
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import closing
+from cache import cache_dir
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _connect():
+    conn = sqlite3.connect(os.path.join(cache_dir("assets"), "assets.sqlite"), timeout=10)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS assets ("
+        " repo TEXT, sha256 TEXT, size INTEGER, release_id INTEGER, tag TEXT,"
+        " asset_id INTEGER, name TEXT, url TEXT, ts REAL, PRIMARY KEY (repo, sha256))"
+    )
+    return conn
+
+
+def lookup(repo: str, sha256: str, size: int):
+    """返回最早登记的同内容附件 {release_id, tag, asset_id, name, url}，没有则返回 None"""
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT release_id, tag, asset_id, name, url FROM assets WHERE repo = ? AND sha256 = ? AND size = ?",
+            (repo, sha256, size),
+        ).fetchone()
+    if not row:
+        return None
+    return dict(zip(("release_id", "tag", "asset_id", "name", "url"), row))
+
+
+def record(repo: str, sha256: str, size: int, release_id: int, tag: str, asset: dict):
+    """登记新上传的附件；同内容已有记录时保留最早的那一条"""
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (repo, sha256, size, release_id, tag, asset.get("id"), asset.get("name"),
+             asset.get("browser_download_url", ""), time.time()),
+        )
+
+
+def forget(repo: str, sha256: str):
+    """附件已在 Gitea 上被删除时移除索引项"""
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM assets WHERE repo = ? AND sha256 = ?", (repo, sha256))
@@ -0,0 +1,298 @@
+# 离线基准：用本地伪 Gitea 服务 + 合成 git 仓库测量部署路径各阶段耗时
+#
+# 用法: python3 .ci/bench/deploy_path.py [--tags 3000] [--sizes 50,200,500] [--json out.json]
+# 全程只访问 127.0.0.1，不需要网络；所有缓存写入临时目录，不污染 Runner 上的真实缓存。
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CI_DIR)
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@localhost",
+    "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@localhost",
+}
+
+
+# ── 伪 Gitea 服务（只实现部署路径用到的接口） ─────────────────────────────
+
+class FakeGitea:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.releases = {}   # id -> release
+        self.next_id = 1
+        self.branches = {}   # name -> sha
+        self.tags = {}       # name -> sha
+
+    def handler(self):
+        gitea = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload=None):
+                body = json.dumps(payload if payload is not None else {}).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _drain(self) -> bytes:
+                """流式读取请求体，只保留开头 4KB（足够解析 multipart 文件名），内存恒定"""
+                remaining = int(self.headers.get("Content-Length") or 0)
+                head = b""
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    if len(head) < 4096:
+                        head += chunk[:4096 - len(head)]
+                    remaining -= len(chunk)
+                self.received = int(self.headers.get("Content-Length") or 0) - remaining
+                return head
+
+            def do_POST(self):
+                head = self._drain()
+                path = self.path.split("?")[0]
+                if path.startswith("/ntfy"):
+                    return self._reply(200)
+                if re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/tags", path):
+                    data = json.loads(head or b"{}")
+                    with gitea.lock:
+                        if data.get("tag_name") in gitea.tags:
+                            return self._reply(409, {"message": "tag already exists"})
+                        gitea.tags[data.get("tag_name")] = data.get("target")
+                    return self._reply(201, {"name": data.get("tag_name"), "commit": {"sha": data.get("target")}})
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/releases", path)
+                if m:
+                    data = json.loads(head or b"{}")
+                    with gitea.lock:
+                        if any(r["tag_name"] == data.get("tag_name") for r in gitea.releases.values()):
+                            return self._reply(409, {"message": "tag already exists"})
+                        release = {"id": gitea.next_id, "tag_name": data.get("tag_name"), "body": data.get("body", ""), "assets": []}
+                        gitea.releases[gitea.next_id] = release
+                        gitea.next_id += 1
+                    return self._reply(201, {k: v for k, v in release.items() if k != "assets"})
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/releases/(\d+)/assets", path)
+                if m:
+                    name = re.search(rb'filename="([^"]+)"', head)
+                    asset = {"id": int(time.time() * 1e6), "name": name.group(1).decode() if name else "asset",
+                             "size": max(0, self.received - len(head.split(b"\r\n\r\n", 1)[0]) - 4 - 40)}
+                    with gitea.lock:
+                        gitea.releases[int(m.group(1))]["assets"].append(asset)
+                    return self._reply(201, asset)
+                self._reply(404, {"message": "not found"})
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/releases/(\d+)/assets", path)
+                if m:
+                    return self._reply(200, gitea.releases.get(int(m.group(1)), {}).get("assets", []))
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/releases/(\d+)/assets/(\d+)", path)
+                if m:
+                    for asset in gitea.releases.get(int(m.group(1)), {}).get("assets", []):
+                        if asset["id"] == int(m.group(2)):
+                            return self._reply(200, asset)
+                    return self._reply(404, {"message": "not found"})
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/releases/(\d+)", path)
+                if m and int(m.group(1)) in gitea.releases:
+                    return self._reply(200, gitea.releases[int(m.group(1))])
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/releases/tags/(.+)", path)
+                if m:
+                    for r in gitea.releases.values():
+                        if r["tag_name"] == m.group(1):
+                            return self._reply(200, r)
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/tags/(.+)", path)
+                if m and m.group(1) in gitea.tags:
+                    return self._reply(200, {"name": m.group(1), "commit": {"sha": gitea.tags[m.group(1)]}})
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/branches/(.+)", path)
+                if m and m.group(1) in gitea.branches:
+                    return self._reply(200, {"name": m.group(1), "commit": {"id": gitea.branches[m.group(1)]}})
+                self._reply(404, {"message": "not found"})
+
+            def do_PATCH(self):
+                data = json.loads(self._drain() or b"{}")
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/releases/(\d+)", self.path.split("?")[0])
+                if m and int(m.group(1)) in gitea.releases:
+                    with gitea.lock:
+                        gitea.releases[int(m.group(1))].update(data)
+                    return self._reply(200, gitea.releases[int(m.group(1))])
+                self._reply(404, {"message": "not found"})
+
+            def do_DELETE(self):
+                m = re.fullmatch(r"/api/v1/repos/[^/]+/[^/]+/tags/(.+)", self.path.split("?")[0])
+                if m:
+                    with gitea.lock:
+                        gitea.tags.pop(m.group(1), None)
+                self._reply(204)
+
+        return Handler
+
+
+def start_fake_gitea():
+    gitea = FakeGitea()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), gitea.handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return gitea, server, f"http://127.0.0.1:{server.server_port}"
+
+
+# ── 合成 git 仓库 ───────────────────────────────────────────────────
+
+def git(*args, cwd=None, input=None):
+    return subprocess.run(["git", *args], cwd=cwd, input=input, check=True, capture_output=True,
+                          env={**os.environ, **GIT_ENV}).stdout.decode().strip()
+
+
+def make_synthetic_repo(root: str, commits: int, tags: int) -> str:
+    """用 fast-import 生成 commits 个提交的裸仓库，并为其打上 tags 个 vX.Y.Z tag"""
+    upstream = os.path.join(root, "upstream.git")
+    git("init", "--bare", "-q", "-b", "main", upstream)
+    stream = io.StringIO()
+    for i in range(1, commits + 1):
+        content = f"// build {i}\n" + "x" * 2048 + "\n"
+        stream.write(f"commit refs/heads/main\nmark :{i}\ncommitter bench <bench@localhost> {1700000000 + i} +0000\n")
+        stream.write(f"data {len(f'commit {i}')}\ncommit {i}\n")
+        if i > 1:
+            stream.write(f"from :{i - 1}\n")
+        stream.write(f"M 644 inline lib/file_{i % 50}.dart\ndata {len(content.encode())}\n{content}\n")
+    git("fast-import", "--quiet", cwd=upstream, input=stream.getvalue().encode())
+
+    head = git("rev-parse", "refs/heads/main", cwd=upstream)
+    # 所有 tag 指向同一提交即可：ls-remote / fetch --tags 的开销只与 ref 数量相关
+    refs = "".join(f"create refs/tags/v{i // 10000}.{i // 100 % 100}.{i % 100} {head}\n" for i in range(tags))
+    git("update-ref", "--stdin", cwd=upstream, input=refs.encode())
+    return upstream
+
+
+def make_workspace(root: str, upstream: str, name: str) -> str:
+    ws = os.path.join(root, name)
+    git("init", "-q", "-b", "main", ws)
+    git("remote", "add", "origin", upstream, cwd=ws)
+    return ws
+
+
+# ── 计时工具 ─────────────────────────────────────────────────────────
+
+@contextlib.contextmanager
+def in_dir(path: str):
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+def timed(results: list, stage: str, fn, verbose: bool = False, **extra):
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stdout if verbose else out):
+        value = fn()
+    elapsed = time.perf_counter() - start
+    results.append({"stage": stage, "seconds": round(elapsed, 4), **extra})
+    print(f"  {stage:<36} {elapsed:8.3f}s " + " ".join(f"{k}={v}" for k, v in extra.items()))
+    return value, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线测量 check_out / get_next_version / 创建 Release / 上传的耗时")
+    parser.add_argument("--tags", type=int, default=3000, help="合成仓库中的 tag 数量")
+    parser.add_argument("--commits", type=int, default=200, help="合成仓库中的提交数量")
+    parser.add_argument("--sizes", default="50,200,500", help="上传产物大小（MB），逗号分隔")
+    parser.add_argument("--json", help="结果写入 JSON 文件")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录")
+    parser.add_argument("--verbose", action="store_true", help="显示被测函数的输出")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="ci-bench-")
+    gitea, server, base_url = start_fake_gitea()
+    os.environ.update({
+        "CI_CACHE_ROOT": os.path.join(root, "cache"),
+        "CI_TRACE": "0",
+        "NTFY_BASE_URL": f"{base_url}/ntfy",
+        "GITEA_REPO": "bench/app",
+    })
+    import core  # noqa: E402  环境变量设置完毕后再导入
+    api_url = f"{base_url}/api/v1"
+    results = []
+
+    try:
+        print(f"🧪 生成合成仓库（{args.commits} 个提交，{args.tags} 个 tag）...")
+        upstream = make_synthetic_repo(root, args.commits, args.tags)
+        head = git("rev-parse", "refs/heads/main", cwd=upstream)
+        gitea.branches["main"] = head
+        os.environ["GITEA_SHA"] = head
+
+        print("⏱️ check_out")
+        for label, cache in (("no-cache", "0"), ("mirror-cold", "1"), ("mirror-warm", "1")):
+            os.environ["CI_GIT_CACHE"] = cache
+            ws = make_workspace(root, upstream, f"ws-{label}")
+            with in_dir(ws):
+                timed(results, f"check_out[{label}]", core.check_out, args.verbose)
+
+        print("⏱️ get_next_version")
+        with in_dir(ws):
+            core._latest_tag_cache.clear()
+            version, _ = timed(results, "get_next_version[ls-remote]", core.get_next_version, args.verbose, tags=args.tags)
+            timed(results, "get_next_version[cached]", core.get_next_version, args.verbose, tags=args.tags)
+            gitea.tags[version] = head  # 模拟并发流水线已占用该版本，测量一次冲突重试
+            version, _ = timed(results, "reserve_version[1 conflict]",
+                               lambda: core.reserve_version(api_url, "bench/app", "token"), args.verbose, tags=args.tags)
+            fetch_ws = make_workspace(root, upstream, "ws-fetch-tags")
+            with in_dir(fetch_ws):
+                timed(results, "latest_tag[fetch --tags]", core._get_latest_tag_by_fetch, args.verbose, tags=args.tags)
+
+            print("⏱️ create_gitea_release")
+            release_id, _ = timed(results, "create_gitea_release",
+                                  lambda: core.create_gitea_release(api_url, "bench/app", "token", version), args.verbose)
+
+        print("⏱️ upload_apk_to_release")
+        for size_mb in (int(s) for s in args.sizes.split(",") if s.strip()):
+            artifact = os.path.join(root, f"app-{size_mb}mb-release.apk")
+            with open(artifact, "wb") as f:
+                f.truncate(size_mb * 1024 * 1024)  # 稀疏文件，不占磁盘
+            _, elapsed = timed(results, f"upload[{size_mb}MB]",
+                               lambda: core.upload_apk_to_release(api_url, "bench/app", "token", release_id, artifact, f"v0.0.{size_mb}"),
+                               args.verbose)
+            results[-1]["mb_per_s"] = round(size_mb / elapsed, 1)
+            print(f"  {'':<36} {size_mb / elapsed:8.1f} MB/s")
+            os.remove(artifact)
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "benchmark": "deploy_path",
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "git": subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip(),
+        "params": {"tags": args.tags, "commits": args.commits, "sizes_mb": args.sizes},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# 基准：每个步骤单独起解释器 vs. 进程内调用的启动开销
+#
+# 用法: python3 .ci/bench/startup.py [--repeat 5] [--json out.json]
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+CI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CI_DIR)
+
+from pipeline import PIPELINE  # noqa: E402
+
+
+# 每个步骤脚本启动时都会导入的模块
+STEP_IMPORTS = ["requests", "semver", "core"]
+
+
+def time_subprocess_startup(repeat: int) -> list:
+    """模拟子进程模式：新解释器 + 导入依赖 + 读取环境"""
+    code = (
+        f"import sys; sys.path.insert(0, {CI_DIR!r}); "
+        + "; ".join(f"import {m}" for m in STEP_IMPORTS)
+    )
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def time_in_process_startup(repeat: int) -> list:
+    """模拟进程内模式：模块已在 sys.modules 中，每个步骤只剩一次字典查找"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for m in STEP_IMPORTS:
+            importlib.import_module(m)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量流水线步骤的解释器启动开销")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    steps = len(PIPELINE)
+    sub = time_subprocess_startup(args.repeat)
+
+    start = time.perf_counter()
+    for m in STEP_IMPORTS:
+        importlib.import_module(m)
+    first_import = time.perf_counter() - start
+    inproc = time_in_process_startup(args.repeat)
+
+    sub_per_step = statistics.median(sub)
+    inproc_per_step = statistics.median(inproc)
+    result = {
+        "benchmark": "step_startup",
+        "steps_per_pipeline": steps,
+        "subprocess_per_step_s": round(sub_per_step, 4),
+        "in_process_first_import_s": round(first_import, 4),
+        "in_process_per_step_s": round(inproc_per_step, 6),
+        "subprocess_per_pipeline_s": round(sub_per_step * steps, 4),
+        "in_process_per_pipeline_s": round(first_import + inproc_per_step * (steps - 1), 4),
+    }
+    result["saved_per_pipeline_s"] = round(result["subprocess_per_pipeline_s"] - result["in_process_per_pipeline_s"], 4)
+
+    print(f"子进程模式: 每步骤 {sub_per_step * 1000:.1f} ms，每条流水线 {result['subprocess_per_pipeline_s'] * 1000:.0f} ms")
+    print(f"进程内模式: 首次导入 {first_import * 1000:.1f} ms，之后每步骤 {inproc_per_step * 1e6:.1f} µs")
+    print(f"⏱️ 每条流水线（{steps} 个步骤）节省约 {result['saved_per_pipeline_s'] * 1000:.0f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# CI Python 环境引导：按依赖哈希复用 Runner 主机上的 virtualenv
+#
+# 仅依赖标准库（在安装 requests 等依赖之前运行）。
+# 用法: PY=$(python3 bootstrap.py --requirements .ci/requirements.txt --packages "requests semver")
+# stdout 只输出 venv 中 python 的路径，其余日志写到 stderr。
+
+import argparse
+import hashlib
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from cache import cache_dir, file_lock, touch
+
+
+READY_MARKER = ".ci-ready"
+DEFAULT_MAX_AGE_DAYS = 14
+
+
+def log(text: str):
+    print(text, file=sys.stderr, flush=True)
+
+
+def venv_key(requirements: str, packages: list) -> str:
+    """依赖文件内容 + 额外包 + Python 版本/架构 → venv 目录名"""
+    h = hashlib.sha256()
+    h.update(f"{sys.version}|{platform.machine()}|{sys.executable}\n".encode("utf-8"))
+    if requirements and os.path.exists(requirements):
+        with open(requirements, "rb") as f:
+            h.update(f.read())
+    h.update(" ".join(sorted(packages)).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def venv_python(venv_dir: str) -> str:
+    return os.path.join(venv_dir, "bin", "python")
+
+
+def build_venv(venv_dir: str, requirements: str, packages: list):
+    log(f"🐍 创建 virtualenv: {venv_dir}")
+    shutil.rmtree(venv_dir, ignore_errors=True)
+    subprocess.run([sys.executable, "-m", "venv", venv_dir], check=True, stdout=sys.stderr)
+
+    pip = [venv_python(venv_dir), "-m", "pip", "install", "-q"]
+    # 保留 pip 下载缓存：哈希变化重建时也不必全部重新下载
+    env = {k: v for k, v in os.environ.items() if k != "PIP_NO_CACHE_DIR"}
+    if requirements and os.path.exists(requirements):
+        log(f"📦 安装 {requirements}")
+        subprocess.run(pip + ["-r", requirements], check=True, env=env, stdout=sys.stderr)
+    if packages:
+        log(f"📦 安装额外依赖: {' '.join(packages)}")
+        subprocess.run(pip + packages, check=True, env=env, stdout=sys.stderr)
+
+    touch(os.path.join(venv_dir, READY_MARKER))
+
+
+def prune_venvs(root: str, keep: str, max_age_days: float):
+    """删除长期未使用的 venv（正在被其他 Job 构建的跳过）"""
+    cutoff = time.time() - max_age_days * 86400
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        marker = os.path.join(path, READY_MARKER)
+        if name == keep or not os.path.isdir(path) or not os.path.exists(marker):
+            continue
+        if os.path.getmtime(marker) >= cutoff:
+            continue
+        try:
+            with file_lock(f"{path}.lock", blocking=False):
+                log(f"🧹 清理过期 venv: {name}")
+                shutil.rmtree(path, ignore_errors=True)
+        except BlockingIOError:
+            pass
+
+
+def ensure_venv(requirements: str, packages: list) -> str:
+    """返回可用 venv 的 python 路径；哈希未变化时直接复用"""
+    root = cache_dir("venvs")
+    key = venv_key(requirements, packages)
+    venv_dir = os.path.join(root, key)
+
+    with file_lock(f"{venv_dir}.lock"):
+        marker = os.path.join(venv_dir, READY_MARKER)
+        if os.path.exists(marker) and os.path.exists(venv_python(venv_dir)):
+            log(f"♻️ 复用缓存的 virtualenv: {key}")
+        else:
+            build_venv(venv_dir, requirements, packages)
+        touch(marker)
+
+    prune_venvs(root, key, float(os.getenv("CI_VENV_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS)))
+    return venv_python(venv_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按依赖哈希复用 CI virtualenv")
+    parser.add_argument("--requirements", default="", help="requirements.txt 路径（不存在则忽略）")
+    parser.add_argument("--packages", default="", help="额外安装的包，空格分隔")
+    args = parser.parse_args()
+
+    print(ensure_venv(args.requirements, args.packages.split()))
+
+
+if __name__ == "__main__":
+    main()
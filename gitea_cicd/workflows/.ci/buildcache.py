@@ -0,0 +1,208 @@
+# Flutter 构建缓存（Runner 本地，按依赖内容哈希分桶，LRU 按大小淘汰）
+
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from cache import cache_dir, dir_size, file_lock, hash_inputs, touch
+
+
+# 决定缓存是否可复用的输入：依赖锁文件 + Gradle Wrapper 版本（Flutter SDK 版本另行传入）
+BUILD_CACHE_INPUTS = [
+    "pubspec.lock",
+    os.path.join("android", "gradle", "wrapper", "gradle-wrapper.properties"),
+]
+DEFAULT_MAX_GB = 20
+
+
+def build_cache_key(flutter_version: str) -> str:
+    return hash_inputs(BUILD_CACHE_INPUTS, extra=[flutter_version])[:24]
+
+
+def warm_gradle_home():
+    """检测 runner/install_real_runner.py 安装的 Gradle 预热服务，返回其 GRADLE_USER_HOME（CI_GRADLE_DAEMON=0 关闭）
+
+    Gradle 只会复用同一 GRADLE_USER_HOME、同一 Gradle 版本且 JVM 参数兼容的守护进程，JVM 参数已由该目录下的
+    gradle.properties 统一；工程的 Gradle 发行版与预热工程不同时不使用该目录，避免在服务 cgroup 之外另起守护进程。
+    """
+    if os.getenv("CI_GRADLE_DAEMON", "1") == "0":
+        return None
+    marker = os.getenv("CI_GRADLE_WARM_MARKER") or os.path.expanduser(os.path.join("~", ".gradle", "ci-warm-daemon.json"))
+    try:
+        with open(marker, encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    home = info.get("gradle_user_home")
+    if not home or not os.path.isdir(home):
+        return None
+    project = _gradle_distribution()
+    if not info.get("distribution_url") or project != info["distribution_url"]:
+        print(f"ℹ️ 工程 Gradle 发行版（{project or '未知'}）与预热守护进程（{info.get('distribution_url') or '未记录'}）不一致，"
+              "不复用预热守护进程")
+        return None
+    return home
+
+
+def _gradle_distribution() -> str:
+    """工程 android/gradle/wrapper/gradle-wrapper.properties 中的 distributionUrl"""
+    path = os.path.join("android", "gradle", "wrapper", "gradle-wrapper.properties")
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("distributionUrl="):
+                    return line.split("=", 1)[1].strip().replace("\\:", ":")
+    except OSError:
+        pass
+    return None
+
+
+@contextmanager
+def flutter_build_cache(flutter_version: str):
+    """在缓存桶内执行构建，产出传给 run_command 的 env
+
+    - PUB_CACHE / GRADLE_USER_HOME 直接指向缓存桶（无需拷贝即可"恢复"）；
+      Runner 装有 Gradle 预热服务时 GRADLE_USER_HOME 改用其目录，以复用常驻守护进程
+    - .dart_tool 构建前拷入工作区，构建成功后回写
+    - 构建期间持有桶的共享锁，淘汰时跳过正在使用的桶
+    CI_BUILD_CACHE=0 时不启用，产出的 env 只包含预热守护进程的 GRADLE_USER_HOME（如有）。
+    """
+    warm_home = warm_gradle_home()
+    if warm_home:
+        print(f"🔥 复用 Gradle 预热守护进程（GRADLE_USER_HOME={warm_home}）")
+    if os.getenv("CI_BUILD_CACHE", "1") == "0":
+        yield {"GRADLE_USER_HOME": warm_home} if warm_home else {}
+        return
+
+    key = build_cache_key(flutter_version)
+    root = cache_dir("build")
+    entry = os.path.join(root, key)
+    os.makedirs(entry, exist_ok=True)
+
+    with file_lock(os.path.join(root, f"{key}.lock"), shared=True):
+        hit = os.path.exists(os.path.join(entry, ".last_used"))
+        print(f"🗃️ 构建缓存{'命中' if hit else '未命中'}: {key}")
+        touch(os.path.join(entry, ".last_used"))
+
+        saved_dart_tool = os.path.join(entry, "dart_tool")
+        if os.path.isdir(saved_dart_tool) and not os.path.exists(".dart_tool"):
+            try:
+                shutil.copytree(saved_dart_tool, ".dart_tool", symlinks=True)
+            except (shutil.Error, OSError) as e:
+                # 并行步骤同时恢复时会互相冲突；不完整的 .dart_tool 由 flutter 自行补齐
+                print(f"⚠️ 恢复 .dart_tool 失败（忽略）: {str(e)[:200]}")
+
+        yield {
+            "PUB_CACHE": os.path.join(entry, "pub-cache"),
+            "GRADLE_USER_HOME": warm_home or os.path.join(entry, "gradle"),
+        }
+
+        if os.path.isdir(".dart_tool"):
+            _save_dir(".dart_tool", saved_dart_tool, os.path.join(root, f"{key}.save.lock"))
+
+    evict_build_cache(root, int(float(os.getenv("CI_BUILD_CACHE_MAX_GB", DEFAULT_MAX_GB)) * 1024 ** 3), keep=key)
+
+
+def _save_dir(src: str, dest: str, lock_path: str):
+    """先拷贝到临时目录再替换，避免并发 Job 读到写了一半的目录
+
+    同一工作区的其他步骤（check / performance 并行）可能正在改写 src，拷贝出错时放弃本次回写。
+    """
+    # 进程内模式下多个步骤共享 pid，临时目录名需带上线程
+    tmp = f"{dest}.tmp-{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        shutil.copytree(src, tmp, symlinks=True)
+    except (shutil.Error, OSError) as e:
+        print(f"⚠️ {src} 在拷贝期间被修改，跳过本次缓存回写: {str(e)[:200]}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    with file_lock(lock_path):
+        old = f"{dest}.old-{os.getpid()}-{threading.get_ident()}"
+        if os.path.exists(dest):
+            os.rename(dest, old)
+        os.rename(tmp, dest)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def evict_build_cache(root: str, max_bytes: int, keep: str = None):
+    """按最近使用时间淘汰缓存桶，直到总大小不超过 max_bytes；使用中的桶与 keep 不会被删除"""
+    entries = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            marker = os.path.join(path, ".last_used")
+            last_used = os.path.getmtime(marker) if os.path.exists(marker) else 0
+            entries.append((last_used, name, path, dir_size(path)))
+
+    total = sum(e[3] for e in entries)
+    for last_used, name, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        try:
+            with file_lock(os.path.join(root, f"{name}.lock"), blocking=False):
+                shutil.rmtree(path, ignore_errors=True)
+        except BlockingIOError:
+            continue
+        total -= size
+        idle_hours = (time.time() - last_used) / 3600
+        print(f"🧹 淘汰构建缓存 {name}（{size / 1024 ** 2:.0f} MB，闲置 {idle_hours:.1f} 小时）")
+
+
+# ── 构建产物复用：按输入指纹保存上一次发布的 APK ───────────────────────
+DEFAULT_ARTIFACT_KEEP = 5
+
+
+def _artifact_root(repo: str) -> str:
+    return cache_dir("artifacts", repo.replace("/", "__"))
+
+
+def find_artifact(repo: str, fingerprint: str):
+    """查找与输入指纹一致的已发布产物，返回 meta（含 paths），未命中返回 None"""
+    entry = os.path.join(_artifact_root(repo), fingerprint)
+    meta_path = os.path.join(entry, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["paths"] = [os.path.join(entry, name) for name in meta.get("files") or [meta["file"]]]
+    if not all(os.path.exists(p) for p in meta["paths"]):
+        return None
+    touch(meta_path)
+    return meta
+
+
+def store_artifact(repo: str, fingerprint: str, artifact_paths: list, **meta):
+    """保存产物与指纹元数据（先写临时目录再 rename），只保留最近 CI_ARTIFACT_KEEP 份"""
+    root = _artifact_root(repo)
+    entry = os.path.join(root, fingerprint)
+    if os.path.exists(os.path.join(entry, "meta.json")):
+        return
+    tmp = f"{entry}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    names = []
+    for path in artifact_paths:
+        names.append(os.path.basename(path))
+        shutil.copy2(path, os.path.join(tmp, names[-1]))
+    meta = {**meta, "fingerprint": fingerprint, "files": names, "stored_at": time.time()}
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # 并发 Job 已写入相同指纹
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    keep = int(os.getenv("CI_ARTIFACT_KEEP", DEFAULT_ARTIFACT_KEEP))
+    entries = sorted(
+        (os.path.getmtime(os.path.join(root, n, "meta.json")), n)
+        for n in os.listdir(root)
+        if os.path.exists(os.path.join(root, n, "meta.json"))
+    )
+    for _, name in entries[:-keep]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -0,0 +1,85 @@
+# Runner 主机本地缓存工具库
+
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+
+
+DEFAULT_CACHE_ROOT = "~/.cache/gitea-ci"
+
+
+def cache_dir(*parts: str) -> str:
+    """返回（并创建）Runner 主机上的缓存目录，根目录可用 CI_CACHE_ROOT 覆盖"""
+    root = os.path.expanduser(os.getenv("CI_CACHE_ROOT") or DEFAULT_CACHE_ROOT)
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_key(text: str, length: int = 16) -> str:
+    """把任意字符串（URL、路径等）转换为适合作目录名的短哈希"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:length]
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False, blocking: bool = True):
+    """基于 flock 的进程间文件锁，同一 Runner 上的多个 Job 共享缓存时使用
+
+    blocking=False 时拿不到锁立即抛出 BlockingIOError。
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        fcntl.flock(f, flags if blocking else flags | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# 计算输入哈希时忽略的目录（构建产物、IDE、本地工具缓存）
+HASH_EXCLUDE_DIRS = {".git", "build", ".gradle", ".dart_tool", ".idea", ".cxx", "__pycache__"}
+
+
+def iter_files(paths):
+    """按稳定顺序遍历文件/目录下的所有文件，不存在的路径直接跳过"""
+    for path in sorted(paths):
+        if os.path.isfile(path):
+            yield path
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if d not in HASH_EXCLUDE_DIRS)
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+
+
+def hash_inputs(paths, extra=()) -> str:
+    """对文件内容（含相对路径）与额外字符串计算 sha256，作为缓存键"""
+    h = hashlib.sha256()
+    for item in extra:
+        h.update(f"extra:{item}\0".encode("utf-8"))
+    for file_path in iter_files(paths):
+        h.update(f"file:{file_path}\0".encode("utf-8"))
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def dir_size(path: str) -> int:
+    """目录占用字节数（不跟随符号链接）"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def touch(path: str):
+    """更新最近使用时间，LRU 淘汰以此为依据"""
+    with open(path, "a"):
+        os.utime(path, None)
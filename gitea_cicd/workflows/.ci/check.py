@@ -0,0 +1,9 @@
+from testshards import run_sharded_tests
+
+
+def main():
+    run_sharded_tests()
+
+
+if __name__ == "__main__":
+    main()
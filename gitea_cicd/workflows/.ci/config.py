@@ -0,0 +1,49 @@
+# 流水线配置：环境变量优先，其次 .ci/ci.ini（可用 CI_CONFIG 指定其他路径）
+#
+# [section] 下的 key 对应环境变量 CI_<SECTION>_<KEY>，例如 [checkout] filter -> CI_CHECKOUT_FILTER。
+
+import configparser
+import os
+import re
+
+
+_parser = None
+
+
+def _load() -> configparser.ConfigParser:
+    global _parser
+    if _parser is None:
+        _parser = configparser.ConfigParser()
+        path = os.getenv("CI_CONFIG") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "ci.ini")
+        _parser.read(path, encoding="utf-8")
+    return _parser
+
+
+def get(section: str, key: str, default: str = None) -> str:
+    value = os.getenv(f"CI_{section}_{key}".upper())
+    if value is None:
+        value = _load().get(section, key, fallback=None)
+    value = value.strip() if value is not None else None
+    return value if value else default
+
+
+def get_bool(section: str, key: str, default: bool = False) -> bool:
+    value = get(section, key)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def get_int(section: str, key: str, default: int = None) -> int:
+    value = get(section, key)
+    return int(value) if value is not None else default
+
+
+def get_float(section: str, key: str, default: float = None) -> float:
+    value = get(section, key)
+    return float(value) if value is not None else default
+
+
+def get_list(section: str, key: str) -> list:
+    """逗号、空白或换行分隔的列表"""
+    return [item for item in re.split(r"[,\s]+", get(section, key) or "") if item]
@@ -1,61 +1,294 @@
+import glob
+import json
 import os
+import shlex
+import sqlite3
 import subprocess
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
 import requests
 from semver import VersionInfo
+from alerts import send_alert
+from buildcache import find_artifact, flutter_build_cache, store_artifact
+from cache import cache_dir, cache_key, file_lock, hash_inputs
+from gitea_client import get_client, normalize_api_url
 from messenger import send_ntfy
+from supersede import exit_if_superseded
+import assetindex
+import config
+import procs
+import tracing
+from tracing import redact, span
 
 
-def run_command(command, capture=True):
-    """封装命令执行，增强编码鲁棒性"""
-    print(f"执行命令: {command}")
-    result = subprocess.run(
-        command,
-        shell=True,
-        capture_output=capture,
-        text=True,
-        encoding='utf-8',      # 强制 UTF-8
-        errors='replace'       # 不可解码字节替换为 �
-    )
+def run_command(command, capture=True, stream=False, tail_lines=None, env=None):
+    """封装命令执行，增强编码鲁棒性
+
+    stream=True 时逐行实时输出 stdout/stderr（合并），内存中仅保留最后
+    tail_lines 行（默认取 CI_LOG_TAIL_LINES，200 行），失败通知与异常均使用该尾部。
+    打印、告警与异常中的命令和输出都经过 redact()，返回值保持原样。
+    """
+    print(f"执行命令: {redact(command)}")
+    run_env = {**os.environ, **env} if env else None
+    # 先 redact 再截断：截断可能落在凭据中间，之后任何模式都无法识别
+    with span(redact(command)[:120], cat="command", command=command) as trace:
+        if stream:
+            return _run_command_streaming(command, tail_lines, run_env, trace)
+
+        # 经 procs 登记，流水线 fail-fast / 被取代时可终止进程内步骤启动的命令
+        pipe = subprocess.PIPE if capture else None
+        with procs.track(procs.popen(
+            command,
+            shell=True,
+            stdout=pipe,
+            stderr=pipe,
+            text=True,
+            encoding='utf-8',      # 强制 UTF-8
+            errors='replace',      # 不可解码字节替换为 �
+            env=run_env,
+        )) as proc:
+            stdout, stderr = proc.communicate()
+        result = subprocess.CompletedProcess(command, proc.returncode, stdout, stderr)
+        trace.update(exit_code=result.returncode, output_bytes=len(result.stdout or "") + len(result.stderr or ""))
     if result.stdout:
-        print(f"输出: {result.stdout.strip()}")
+        print(f"输出: {redact(result.stdout.strip())}")
     if result.stderr:
-        print(f"错误输出: {result.stderr.strip()}")
+        print(f"错误输出: {redact(result.stderr.strip())}")
     if result.returncode != 0:
-        error_msg = f"❌ 命令执行失败（返回码 {result.returncode}）: {command}\n错误详情: {result.stderr or '无错误输出'}"
-        send_ntfy(error_msg, title="命令执行失败", priority="high")
-        raise RuntimeError(error_msg)
+        error_msg = redact(f"❌ 命令执行失败（返回码 {result.returncode}）: {command}\n错误详情: {result.stderr or '无错误输出'}")
+        _raise_command_error(error_msg)
     return result.stdout.strip()
 
+
+def _run_command_streaming(command, tail_lines=None, env=None, trace=None):
+    """流式执行命令：边运行边打印，仅用环形缓冲保留尾部日志"""
+    trace = {} if trace is None else trace
+    if tail_lines is None:
+        tail_lines = int(os.getenv("CI_LOG_TAIL_LINES", "200"))
+    tail = deque(maxlen=tail_lines)
+
+    proc = procs.popen(
+        command,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,  # 合并 stderr，保持两者的原始交错顺序
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        bufsize=1,
+        env=env,
+    )
+    output_bytes = 0
+    with procs.track(proc), proc.stdout:
+        for line in proc.stdout:
+            line = redact(line)
+            print(line, end="", flush=True)
+            tail.append(line.rstrip("\n"))
+            output_bytes += len(line)
+        returncode = proc.wait()
+    trace.update(exit_code=returncode, output_bytes=output_bytes)
+
+    output = "\n".join(tail).strip()
+    if returncode != 0:
+        error_msg = (
+            f"❌ 命令执行失败（返回码 {returncode}）: {redact(command)}\n"
+            f"错误详情（最后 {len(tail)} 行）:\n{output or '无错误输出'}"
+        )
+        _raise_command_error(error_msg)
+    return output
+
+
+def _raise_command_error(error_msg: str):
+    """发送（去重后的）失败告警并抛出；异常上标记 ci_alerted，上层不再重复告警
+
+    fail-fast / 取代取消时命令是被流水线终止的，不是真正的失败，不发告警。
+    """
+    if procs.cancelled():
+        error = RuntimeError(f"🛑 命令已随流水线取消而终止\n{error_msg}")
+        error.ci_alerted = True
+        raise error
+    send_alert(error_msg, title="命令执行失败")
+    error = RuntimeError(error_msg)
+    error.ci_alerted = True
+    raise error
+
+
 def check_out():
-    """签出代码,取代actions/checkout@v4, 避免对Node.js依赖"""
+    """签出代码,取代actions/checkout@v4, 避免对Node.js依赖
+
+    可选项（环境变量优先，其次 .ci/ci.ini 的 [checkout] 段）：
+      CI_CHECKOUT_FILTER          部分克隆过滤器，如 blob:none（按需拉取文件内容）
+      CI_CHECKOUT_SPARSE          sparse-checkout 路径/模式，逗号或空白分隔
+      CI_CHECKOUT_SUBMODULES      1 时初始化并更新子模块
+      CI_CHECKOUT_SUBMODULE_JOBS  子模块并行更新数（默认 CPU 核数）
+    """
     print("📂 开始手动检出代码...")
     
     # 获取当前 commit SHA（Gitea Actions 提供 GITEA_SHA 环境变量）
     sha = os.getenv("GITEA_SHA", "main")
     print(f"目标 SHA/分支: {sha}")
+
+    filter_spec = config.get("checkout", "filter")
+    _configure_sparse_checkout(config.get_list("checkout", "sparse"))
+
+    # 优先使用 Runner 本地的 bare mirror 缓存（CI_GIT_CACHE=0 可关闭）；
+    # 部分克隆依赖向 origin 按需补取对象，与 alternates 方式互斥
+    if os.getenv("CI_GIT_CACHE", "1") != "0" and not filter_spec:
+        try:
+            if _checkout_from_mirror(sha):
+                _update_submodules(filter_spec)
+                print("✅ 代码检出完成（本地 mirror 缓存）")
+                return
+        except RuntimeError as e:
+            print(f"⚠️ mirror 缓存不可用，回退到直接拉取: {e}")
     
     # 浅克隆以优化速度（若需完整历史，可移除 --depth=1）
-    run_command(f"git fetch --depth=1 origin {sha}")
+    filter_arg = f" --filter={filter_spec}" if filter_spec else ""
+    run_command(f"git fetch --depth=1{filter_arg} origin {sha}")
     run_command(f"git checkout {sha}")
-    
-    # 若项目包含子模块，可取消注释以下行
-    # run_command("git submodule update --init --recursive")
+    _update_submodules(filter_spec)
     
     print("✅ 代码检出完成")
 
 
+def _configure_sparse_checkout(patterns: list):
+    """在 checkout 之前设置 sparse-checkout，工作区只落地需要的路径"""
+    if not patterns:
+        if run_command("git config --bool --default false core.sparseCheckout") == "true":
+            run_command("git sparse-checkout disable")
+        return
+    # 纯目录列表使用 cone 模式（更快，且总会包含仓库根目录下的文件）；
+    # 含通配符或具体文件时退回到普通模式
+    cone = not any(ch in p for p in patterns for ch in "*?[!") and not any(
+        "." in os.path.basename(p.rstrip("/")) for p in patterns)
+    quoted = " ".join(shlex.quote(p) for p in patterns)
+    run_command(f"git sparse-checkout set {'--cone' if cone else '--no-cone'} {quoted}")
+
+
+def _update_submodules(filter_spec: str = None):
+    if not config.get_bool("checkout", "submodules", False):
+        return
+    jobs = config.get_int("checkout", "submodule_jobs", os.cpu_count() or 4)
+    filter_arg = f" --filter={filter_spec}" if filter_spec else ""
+    run_command(f"git submodule update --init --recursive --depth 1 --jobs {jobs}{filter_arg}")
+
+
+def _strip_credentials(url: str) -> str:
+    """去掉 URL 中的账号/Token，作为 mirror 的缓存键（Job Token 每次都会变化）"""
+    parts = urlsplit(url)
+    if parts.username or parts.password:
+        netloc = parts.hostname + (f":{parts.port}" if parts.port else "")
+        return urlunsplit(parts._replace(netloc=netloc))
+    return url
+
+
+def _update_git_mirror(remote_url: str) -> str:
+    """创建/增量更新 Runner 本地 bare mirror，返回 mirror 路径
+
+    同一 Runner 上的并发 Job 通过 flock 串行更新；fetch 直接使用本次 Job 的
+    远程 URL，不把 Token 写入 mirror 配置。gc 时 pruneExpire=never，
+    避免删除正在被其他 Job 通过 alternates 引用的对象。
+    """
+    mirror = os.path.join(cache_dir("git"), cache_key(_strip_credentials(remote_url)) + ".git")
+    with file_lock(mirror + ".lock"):
+        if not os.path.isdir(mirror):
+            print(f"🗄️ 初始化本地 git mirror: {mirror}")
+            run_command(f"git init --bare --quiet {mirror}")
+        run_command(f"git --git-dir={mirror} fetch --prune --quiet {remote_url} '+refs/heads/*:refs/heads/*' '+refs/tags/*:refs/tags/*'")
+        run_command(f"git --git-dir={mirror} -c gc.autoPackLimit=50 -c gc.pruneExpire=never gc --auto --quiet")
+    return mirror
+
+
+def _checkout_from_mirror(sha: str) -> bool:
+    """借助 mirror + alternates 检出，工作区只引用对象而不复制；mirror 中找不到目标时返回 False"""
+    remote_url = run_command("git remote get-url origin")
+    mirror = _update_git_mirror(remote_url)
+
+    probe = subprocess.run(
+        ["git", f"--git-dir={mirror}", "rev-parse", "--verify", "--quiet", f"{sha}^{{commit}}"],
+        capture_output=True, text=True,
+    )
+    commit = probe.stdout.strip()
+    if probe.returncode != 0 or not commit:
+        print(f"⚠️ mirror 中未找到 {sha}")
+        return False
+
+    alternates = run_command("git rev-parse --path-format=absolute --git-path objects/info/alternates")
+    mirror_objects = os.path.join(mirror, "objects")
+    existing = open(alternates, encoding="utf-8").read().splitlines() if os.path.exists(alternates) else []
+    if mirror_objects not in existing:
+        os.makedirs(os.path.dirname(alternates), exist_ok=True)
+        with open(alternates, "a", encoding="utf-8") as f:
+            f.write(mirror_objects + "\n")
+
+    run_command(f"git checkout {commit}")
+    return True
+
+
+# 本 Job 内的最新 tag 缓存：remote -> (tag, sha) 或 None
+_latest_tag_cache = {}
+
+
+def get_latest_tag(remote: str = "origin", refresh: bool = False):
+    """通过 git ls-remote 一次性读取远程 tag，返回最新的 vX.Y.Z 及其提交 (tag, sha)
+
+    不拉取任何对象；单次遍历按 semver 取最大值，无法解析的 tag 直接忽略。
+    结果在当前进程内缓存，无 tag 时返回 None。
+    """
+    if not refresh and remote in _latest_tag_cache:
+        return _latest_tag_cache[remote]
+
+    result = subprocess.run(
+        ["git", "ls-remote", "--tags", remote],
+        capture_output=True, text=True, encoding="utf-8", errors="replace",
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git ls-remote 失败: {result.stderr.strip()}")
+
+    # 附注 tag 会额外出现一行 refs/tags/<name>^{}，其 sha 才是实际提交
+    peeled = {}
+    candidates = {}
+    for line in result.stdout.splitlines():
+        sha, _, ref = line.partition("\t")
+        if not ref.startswith("refs/tags/v"):
+            continue
+        name = ref[len("refs/tags/"):]
+        if name.endswith("^{}"):
+            peeled[name[:-3]] = sha
+        else:
+            candidates[name] = sha
+
+    latest, latest_ver = None, None
+    for name in candidates:
+        try:
+            ver = VersionInfo.parse(name[1:])
+        except ValueError:
+            continue
+        if latest_ver is None or ver > latest_ver:
+            latest, latest_ver = name, ver
+
+    print(f"远程共 {len(candidates)} 个 v* tag，最新: {latest or '无'}")
+    resolved = (latest, peeled.get(latest, candidates.get(latest))) if latest else None
+    _latest_tag_cache[remote] = resolved
+    return resolved
+
+
 def get_next_version():
     """计算下一个 semantic 版本号（默认 bump patch）"""
     print("正在获取最新 tag...")
-    run_command("git fetch --tags --quiet")
-    tags_output = run_command("git tag --sort=-version:refname")
-    tags = [t.lstrip("v") for t in tags_output.splitlines() if t.startswith("v")]
+    try:
+        latest_tag = get_latest_tag()
+    except RuntimeError as e:
+        print(f"⚠️ ls-remote 读取 tag 失败，回退到 fetch 方式: {e}")
+        latest_tag = _get_latest_tag_by_fetch()
 
-    if not tags:
+    if not latest_tag:
         print("未找到现有 tag，默认从 v1.0.0 开始")
         return "v1.0.0"
 
-    latest = tags[0]
+    latest = latest_tag[0].lstrip("v")
     print(f"当前最新版本: v{latest}")
 
     try:
@@ -69,99 +302,301 @@ def get_next_version():
         return "v1.0.0"
 
 
+def reserve_version(api_url: str, repo: str, token: str, attempts: int = None) -> str:
+    """通过 Gitea API 先创建 tag 占住版本号，冲突时递增 patch 重试，返回占到的版本
+
+    并发部署时两条流水线会算出相同的版本号；tag 创建是原子的，只有一方能成功，
+    另一方在构建开始前就换用下一个版本，而不是构建完成后才在创建 Release 时失败。
+    """
+    attempts = attempts or int(os.getenv("CI_VERSION_RESERVE_ATTEMPTS", "10"))
+    client = get_client(api_url, token)
+    target = os.getenv("GITEA_SHA") or run_command("git rev-parse HEAD")
+    version = get_next_version()
+
+    for _ in range(attempts):
+        if client.create_tag(repo, version, target, message=f"CI 自动发布 {version}"):
+            print(f"🔖 已占用版本号 {version}（tag → {target[:8]}）")
+            return version
+        # 被其他流水线抢先：以远程最新 tag 与当前候选中较大者为基准递增
+        latest = get_latest_tag(refresh=True)
+        candidate = VersionInfo.parse(version.lstrip("v"))
+        if latest:
+            try:
+                candidate = max(candidate, VersionInfo.parse(latest[0].lstrip("v")))
+            except ValueError:
+                pass
+        next_version = f"v{candidate.bump_patch()}"
+        print(f"⚠️ 版本号 {version} 已被占用，改用 {next_version}")
+        version = next_version
+    raise RuntimeError(f"连续 {attempts} 次未能占用版本号（最后尝试 {version}）")
+
+
+def release_version(api_url: str, repo: str, token: str, version: str):
+    """部署失败且尚未创建 Release 时删除占位 tag，归还版本号"""
+    try:
+        get_client(api_url, token).delete_tag(repo, version)
+        print(f"↩️ 已删除占位 tag {version}")
+    except Exception as e:
+        print(f"⚠️ 删除占位 tag {version} 失败，请手动清理: {e}")
+
+
+def _get_latest_tag_by_fetch():
+    """旧方式：拉取全部 tag 后在本地排序，仅作为 ls-remote 不可用时的兜底"""
+    run_command("git fetch --tags --quiet")
+    tags_output = run_command("git tag --sort=-version:refname")
+    tags = [t for t in tags_output.splitlines() if t.startswith("v")]
+    return (tags[0], None) if tags else None
+
+
+_flutter_version = None
+
+
+def get_flutter_version() -> str:
+    """读取 Flutter SDK 版本（framework 修订号 + Dart 版本），用作缓存键的一部分"""
+    global _flutter_version
+    if _flutter_version is None:
+        output = run_command("flutter --version --machine")
+        info = json.loads(output[output.index("{"):])  # 首次运行可能先输出下载提示
+        _flutter_version = f"{info.get('frameworkVersion')}@{info.get('frameworkRevision')}/dart-{info.get('dartSdkVersion')}"
+    return _flutter_version
+
+
 def build_flutter_apk():
     """执行 Flutter 构建并返回 APK 路径（增强容错）"""
-    print("🚀 开始 Flutter 构建 APK...")
-    run_command("flutter pub get")
-    
-    # 执行构建，即使返回非零也继续检查文件存在性
-    try:
-        run_command("flutter build apk --release")
-    except RuntimeError as e:
-        print(f"⚠️ 构建命令返回非零码，但继续检查 APK 文件: {e}")
+    return build_flutter_artifacts(split_per_abi=False, aab=False)[0]
+
+
+def artifact_build_mode():
+    """产物构建模式：CI_APK_SPLIT_PER_ABI=1 按 ABI 拆分 APK，CI_BUILD_AAB=1 额外构建 AAB"""
+    return os.getenv("CI_APK_SPLIT_PER_ABI") == "1", os.getenv("CI_BUILD_AAB") == "1"
+
+
+def build_flutter_artifacts(split_per_abi: bool = None, aab: bool = None) -> list:
+    """执行 Flutter 构建并返回产物路径列表（按 ABI 拆分的 APK / 单个 fat APK，以及可选的 AAB）"""
+    default_split, default_aab = artifact_build_mode()
+    split_per_abi = default_split if split_per_abi is None else split_per_abi
+    aab = default_aab if aab is None else aab
+
+    print(f"🚀 开始 Flutter 构建 {'按 ABI 拆分的 APK' if split_per_abi else 'APK'}{' + AAB' if aab else ''}...")
+    # 留出文件系统 mtime 精度的余量
+    build_start = time.time() - 2
+    with flutter_build_cache(get_flutter_version()) as cache_env:
+        run_command("flutter pub get", env=cache_env)
+
+        # 执行构建，即使返回非零也继续检查文件存在性（下方会拒绝本次构建之前遗留的旧产物）
+        try:
+            run_command(f"flutter build apk --release{' --split-per-abi' if split_per_abi else ''}", stream=True, env=cache_env)
+        except RuntimeError as e:
+            print(f"⚠️ 构建命令返回非零码，但继续检查 APK 文件: {e}")
+        if aab:
+            run_command("flutter build appbundle --release", stream=True, env=cache_env)
 
     # apk_path = "build/app/outputs/flutter-apk/app-release.apk"
     # 计算项目根目录（从 core.py 所在 .ci 目录向上一级）
     project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    outputs = os.path.join(project_root, "build", "app", "outputs")
     # 构造绝对路径（跨平台兼容，使用 os.path.join 自动处理 \ 或 /）
-    apk_path = os.path.join(project_root, "build", "app", "outputs", "flutter-apk", "app-release.apk")
-    
-    print(f"APK路径: {apk_path}")
-    if not os.path.exists(apk_path):
-        raise FileNotFoundError(f"APK 文件未生成或路径错误: {apk_path}")
-    print(f"✅ APK 构建成功: {apk_path}")
-    return apk_path
+    if split_per_abi:
+        artifacts = sorted(glob.glob(os.path.join(outputs, "flutter-apk", "app-*-release.apk")))
+        if not artifacts:
+            raise FileNotFoundError(f"按 ABI 拆分的 APK 未生成或路径错误: {os.path.join(outputs, 'flutter-apk')}")
+    else:
+        apk_path = os.path.join(outputs, "flutter-apk", "app-release.apk")
+        print(f"APK路径: {apk_path}")
+        if not os.path.exists(apk_path):
+            raise FileNotFoundError(f"APK 文件未生成或路径错误: {apk_path}")
+        artifacts = [apk_path]
+    if aab:
+        aab_path = os.path.join(outputs, "bundle", "release", "app-release.aab")
+        if not os.path.exists(aab_path):
+            raise FileNotFoundError(f"AAB 文件未生成或路径错误: {aab_path}")
+        artifacts.append(aab_path)
 
+    # 构建失败时 build/ 下可能还留着上次的产物，不能当作本次结果发布或缓存
+    stale = [path for path in artifacts if os.path.getmtime(path) < build_start]
+    if stale:
+        raise RuntimeError("构建产物早于本次构建开始时间（构建可能失败）: " + ", ".join(stale))
 
-def create_gitea_release(api_url: str, repo: str, token: str, version: str):
-    """创建 Gitea Release，返回 release_id"""
-    print("🌐 正在创建 Gitea Release...")
-    headers = {
-        "Authorization": f"token {token}",
-        "Content-Type": "application/json"
-    }
+    for path in artifacts:
+        print(f"✅ 构建产物: {path}（{os.path.getsize(path) / 1024 ** 2:.1f} MB）")
+    return artifacts
+
+
+# 影响 APK 内容的输入；纯文档、CI 脚本改动不会改变指纹
+APK_FINGERPRINT_INPUTS = ["lib", "android", "assets", "pubspec.yaml", "pubspec.lock"]
 
+
+def compute_build_fingerprint() -> str:
+    """计算 APK 输入指纹：受版本控制的输入文件内容 + Flutter SDK 版本
+
+    只哈希 git 跟踪的文件，构建期间生成的 local.properties 等不会干扰指纹。
+    """
+    result = subprocess.run(
+        ["git", "ls-files", "--", *APK_FINGERPRINT_INPUTS],
+        capture_output=True, text=True, encoding="utf-8", errors="replace",
+    )
+    files = result.stdout.splitlines() if result.returncode == 0 and result.stdout else APK_FINGERPRINT_INPUTS
+    split_per_abi, aab = artifact_build_mode()
+    return hash_inputs(files, extra=[get_flutter_version(), f"split={split_per_abi}", f"aab={aab}"])[:32]
+
+
+def create_gitea_release(api_url: str, repo: str, token: str, version: str, body: str = None):
+    """创建 Gitea Release，返回 release_id（tag 已由 reserve_version 创建时直接挂在该 tag 上）"""
+    print("🌐 正在创建 Gitea Release...")
     current_branch = run_command("git rev-parse --abbrev-ref HEAD")
 
     release_data = {
         "tag_name": version,
         "target_commitish": current_branch,
         "name": f"Release {version}",
-        "body": f"自动发布版本 {version}",
+        "body": body or f"自动发布版本 {version}",
         "draft": False,
         "prerelease": False,
     }
 
-    url = f"{api_url}/repos/{repo}/releases"
-    resp = requests.post(url, json=release_data, headers=headers)
-    resp.raise_for_status()
-    release_id = resp.json()["id"]
+    release_id = get_client(api_url, token).create_release(repo, release_data)["id"]
     print(f"✅ Release 创建成功，ID: {release_id}")
     return release_id
 
 
+ARTIFACT_CONTENT_TYPES = {
+    ".apk": "application/vnd.android.package-archive",
+    ".aab": "application/octet-stream",
+}
+
+
+def release_asset_name(artifact_path: str, version: str) -> str:
+    """app-arm64-v8a-release.apk + v1.2.3 → app-arm64-v8a-release-1.2.3.apk"""
+    stem, ext = os.path.splitext(os.path.basename(artifact_path))
+    return f"{stem}-{version.lstrip('v')}{ext}"
+
+
 def upload_apk_to_release(api_url: str, repo: str, token: str, release_id: int, apk_path: str, version: str):
-    """上传 APK 到指定 Release"""
-    print("📤 正在上传 APK...")
-    filename = f"app-release-{version.lstrip('v')}.apk"
-    url = f"{api_url}/repos/{repo}/releases/{release_id}/assets"
-    headers = {"Authorization": f"token {token}"}
-
-    with open(apk_path, "rb") as f:
-        files = {
-            "attachment": (
-                filename,
-                f,
-                "application/vnd.android.package-archive",
-            )
-        }
-        resp = requests.post(url, headers=headers, files=files)
-        resp.raise_for_status()
+    """上传 APK 到指定 Release（流式 multipart，失败按抖动退避重试）"""
+    upload_artifacts_to_release(api_url, repo, token, release_id, [apk_path], version)
+
+
+def upload_artifacts_to_release(api_url: str, repo: str, token: str, release_id: int, artifacts: list, version: str):
+    """用有界线程池并发上传多个产物，共享同一个 GiteaClient 连接池（CI_UPLOAD_WORKERS 控制并发数）
+
+    与此前某个 Release 附件内容（sha256）完全相同的产物不再上传，改为在 Release 说明中
+    链接到已有附件（CI_UPLOAD_DEDUP=0 关闭）。
+    """
+    client = get_client(api_url, token)
+    workers = max(1, min(len(artifacts), int(os.getenv("CI_UPLOAD_WORKERS", "3"))))
+    dedup = config.get_bool("upload", "dedup", True)
+    print(f"📤 正在上传 {len(artifacts)} 个产物（并发 {workers}）...")
 
-    print(f"✅ APK 上传成功: {filename}")
+    def upload(path):
+        filename = release_asset_name(path, version)
+        size = os.path.getsize(path)
+        digest = assetindex.file_sha256(path) if dedup else None
+        if digest:
+            existing = _find_uploaded_asset(client, repo, digest, size)
+            if existing and existing["release_id"] == release_id:
+                print(f"✅ 本 Release 已包含相同附件 {existing['name']}，跳过")
+                return None
+            if existing:
+                print(f"♻️ {filename} 与 {existing['tag']} 的附件 {existing['name']} 内容相同，跳过上传")
+                return f"- `{filename}` 与 {existing['tag']} 的附件相同: [{existing['name']}]({existing['url']})"
+        content_type = ARTIFACT_CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+        asset, throughput = client.upload_release_asset(repo, release_id, path, filename, content_type)
+        print(f"✅ 上传成功: {filename}（平均 {throughput / 1024 ** 2:.2f} MB/s）")
+        if digest:
+            try:
+                assetindex.record(repo, digest, size, release_id, version, asset)
+            except sqlite3.Error as e:
+                print(f"⚠️ 附件索引写入失败（忽略）: {e}")
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() 让任一上传的异常在这里抛出
+        links = [link for link in pool.map(upload, artifacts) if link]
+
+    if links:
+        release = client.get_release(repo, release_id)
+        body = (release.get("body") or "").rstrip()
+        client.edit_release(repo, release_id, body=f"{body}\n\n📎 以下产物与历史版本完全相同，未重复上传:\n" + "\n".join(links))
+
+
+def _find_uploaded_asset(client, repo: str, digest: str, size: int):
+    """在本地索引中查找同内容附件，并向 Gitea 确认它仍然存在"""
+    try:
+        existing = assetindex.lookup(repo, digest, size)
+    except sqlite3.Error as e:
+        print(f"⚠️ 附件索引不可用（忽略）: {e}")
+        return None
+    if not existing:
+        return None
+    # 查询或清理失败时放弃去重，按正常流程上传
+    try:
+        asset = client.get_release_asset(repo, existing["release_id"], existing["asset_id"])
+    except (requests.RequestException, ValueError) as e:
+        print(f"⚠️ 无法确认已上传的同内容附件（忽略，正常上传）: {e}")
+        return None
+    if not asset or asset.get("size") != size:
+        try:
+            assetindex.forget(repo, digest)
+        except sqlite3.Error as e:
+            print(f"⚠️ 附件索引不可用（忽略）: {e}")
+        return None
+    existing["url"] = asset.get("browser_download_url") or existing["url"]
+    return existing
+
+
+def _upload_trace(api_url: str, repo: str, token: str, release_id: int, version: str):
+    """把截至目前的流水线耗时追踪作为 Release 附件上传（失败不影响发布）"""
+    try:
+        trace_path = tracing.merge(os.path.join(tracing.trace_dir(), f"ci-trace-{version.lstrip('v')}.json"))
+        get_client(api_url, token).upload_release_asset(
+            repo, release_id, trace_path, os.path.basename(trace_path), "application/json"
+        )
+        print(f"📊 耗时追踪已附加到 Release: {os.path.basename(trace_path)}")
+    except Exception as e:
+        print(f"⚠️ 上传耗时追踪失败（忽略）: {e}")
 
 
 def perform_deploy(gitea_token: str, gitea_api_url: str, gitea_repo: str):
     """核心部署流程"""
+    version = None
+    release_id = None
     try:
         print("=== 开始 CI/CD 部署流程 ===")
 
-        api_url = gitea_api_url.rstrip("/")
-        if "/api/v1" not in api_url:
-            api_url += "/api/v1"
+        api_url = normalize_api_url(gitea_api_url)
 
-        version = get_next_version()
+        # 构建耗时最长：开始前再确认一次本提交仍是分支最新，否则直接让位给新的运行
+        exit_if_superseded()
+
+        version = reserve_version(api_url, gitea_repo, gitea_token)
         print(f"📦 目标发布版本: {version}")
 
-        apk_path = build_flutter_apk()
+        fingerprint = compute_build_fingerprint()
+        reused = find_artifact(gitea_repo, fingerprint)
+        if reused:
+            build_note = f"输入指纹与 {reused['version']} 一致（lib/android/assets/pubspec 与 Flutter 版本均未变化），跳过构建并复用其 APK"
+            print(f"♻️ {build_note}")
+            artifacts = reused["paths"]
+        else:
+            build_note = None
+            artifacts = build_flutter_artifacts()
+
+        release_body = f"自动发布版本 {version}\n\n构建输入指纹: `{fingerprint}`"
+        if build_note:
+            release_body += f"\n\n♻️ {build_note}"
+        release_id = create_gitea_release(api_url, gitea_repo, gitea_token, version, body=release_body)
+
+        upload_artifacts_to_release(api_url, gitea_repo, gitea_token, release_id, artifacts, version)
 
-        release_id = create_gitea_release(api_url, gitea_repo, gitea_token, version)
+        if os.getenv("CI_TRACE_UPLOAD") == "1" and tracing.enabled():
+            _upload_trace(api_url, gitea_repo, gitea_token, release_id, version)
 
-        upload_apk_to_release(api_url, gitea_repo, gitea_token, release_id, apk_path, version)
+        if not reused:
+            store_artifact(gitea_repo, fingerprint, artifacts, version=version, sha=os.getenv("GITEA_SHA", ""))
 
         try:
             send_ntfy(
-                f"版本 {version} 发布成功！\nAPK 已上传至 Release。",
+                f"版本 {version} 发布成功！\nAPK 已上传至 Release。" + (f"\n{build_note}" if build_note else ""),
                 title="✅ 发布成功",
                 tags="package,tada",
             )
@@ -173,8 +608,13 @@ def perform_deploy(gitea_token: str, gitea_api_url: str, gitea_repo: str):
     except Exception as e:
         error_detail = f"部署流程异常: {str(e)}"
         print(error_detail)
+        if version and release_id is None:
+            release_version(normalize_api_url(gitea_api_url), gitea_repo, gitea_token, version)
+        if getattr(e, "ci_alerted", False):
+            print("ℹ️ 该错误已在命令失败时告警，不再重复发送")
+            raise
         try:
-            send_ntfy(error_detail, title="部署失败", priority="high")
+            send_alert(error_detail, title="部署失败")
         except Exception as notify_e:
             print(f"⚠️ 失败通知发送失败（可忽略）: {notify_e}")
         raise
\ No newline at end of file
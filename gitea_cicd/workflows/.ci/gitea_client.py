@@ -0,0 +1,202 @@
+# Gitea API 客户端：长连接池 + 超时 + 抖动退避重试，供所有流水线步骤共享
+
+import os
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from multipart import MultipartFileStream
+from tracing import span
+
+
+RETRYABLE_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+
+def normalize_api_url(api_url: str) -> str:
+    """补全 /api/v1 后缀"""
+    api_url = api_url.rstrip("/")
+    if "/api/v1" not in api_url:
+        api_url += "/api/v1"
+    return api_url
+
+
+class GiteaClient:
+    """持有 keep-alive Session 的 Gitea API 客户端
+
+    - 连接池大小 pool_size（并发上传时复用同一组 TCP 连接）
+    - 每次调用都有超时（connect, read），默认读超时取 CI_HTTP_TIMEOUT
+    - 连接重置/超时/5xx 时按指数退避 + 随机抖动重试，最多 CI_HTTP_RETRIES 次（附件上传为 CI_UPLOAD_RETRIES 次尝试）
+    """
+
+    def __init__(self, api_url: str, token: str, pool_size: int = 8, timeout=None, retries: int = None,
+                 backoff: float = 1.0, max_backoff: float = 30.0):
+        self.api_url = normalize_api_url(api_url)
+        self.timeout = timeout or (10, float(os.getenv("CI_HTTP_TIMEOUT", "60")))
+        self.retries = int(os.getenv("CI_HTTP_RETRIES", "3")) if retries is None else retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Authorization"] = f"token {token}"
+
+    def _url(self, path: str) -> str:
+        if path.startswith(("http://", "https://")):
+            return path
+        return f"{self.api_url}/{path.lstrip('/')}"
+
+    def _sleep_before_retry(self, attempt: int, reason):
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+        print(f"⚠️ Gitea 请求失败（{reason}），{delay:.1f} 秒后第 {attempt + 1} 次重试...")
+        time.sleep(delay)
+
+    def request(self, method: str, path: str, timeout=None, retry: bool = True, **kwargs) -> requests.Response:
+        """发送请求；非 2xx 最终抛出 HTTPError。带 reset() 的请求体在每次重试前会被重置"""
+        url = self._url(path)
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            body = kwargs.get("data")
+            if hasattr(body, "reset"):
+                body.reset()
+            try:
+                with span(f"{method} {path}", cat="http", attempt=attempt + 1) as trace:
+                    resp = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+                    trace.update(
+                        status=resp.status_code,
+                        bytes_sent=int(resp.request.headers.get("Content-Length") or 0),
+                        bytes_received=len(resp.content),
+                    )
+            except RETRYABLE_EXCEPTIONS as e:
+                if last:
+                    raise
+                self._sleep_before_retry(attempt, e)
+                continue
+            if resp.status_code >= 500 and not last:
+                self._sleep_before_retry(attempt, f"HTTP {resp.status_code}")
+                continue
+            resp.raise_for_status()
+            return resp
+
+    def get(self, path: str, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path: str, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path: str, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    # ── Tag / Release 相关 ───────────────────────────────────────────
+
+    def create_release(self, repo: str, release_data: dict) -> dict:
+        """创建 Release；重试导致的 409（上一次其实已成功）时返回已存在的 Release"""
+        try:
+            return self.post(f"repos/{repo}/releases", json=release_data).json()
+        except requests.HTTPError as e:
+            if getattr(e.response, "status_code", None) != 409:
+                raise
+            return self.get(f"repos/{repo}/releases/tags/{release_data['tag_name']}").json()
+
+    def create_tag(self, repo: str, tag: str, target: str, message: str = "") -> bool:
+        """创建 tag；tag 已存在（409）时返回 False。不自动重试，避免把自己的创建误判为冲突"""
+        try:
+            self.post(f"repos/{repo}/tags", json={"tag_name": tag, "target": target, "message": message}, retry=False)
+            return True
+        except requests.HTTPError as e:
+            if getattr(e.response, "status_code", None) != 409:
+                raise
+            return False
+        except RETRYABLE_EXCEPTIONS:
+            # 请求结果未知：tag 若已存在且指向本提交，视为本次创建成功
+            existing = self.get_tag(repo, tag)
+            if existing is None:
+                raise
+            return existing.get("commit", {}).get("sha") == target
+
+    def get_tag(self, repo: str, tag: str):
+        try:
+            return self.get(f"repos/{repo}/tags/{tag}").json()
+        except requests.HTTPError as e:
+            if getattr(e.response, "status_code", None) == 404:
+                return None
+            raise
+
+    def delete_tag(self, repo: str, tag: str):
+        self.delete(f"repos/{repo}/tags/{tag}")
+
+    def edit_release(self, repo: str, release_id: int, **fields) -> dict:
+        return self.patch(f"repos/{repo}/releases/{release_id}", json=fields).json()
+
+    def get_release(self, repo: str, release_id: int) -> dict:
+        return self.get(f"repos/{repo}/releases/{release_id}").json()
+
+    def list_release_assets(self, repo: str, release_id: int) -> list:
+        return self.get(f"repos/{repo}/releases/{release_id}/assets").json()
+
+    def get_release_asset(self, repo: str, release_id: int, asset_id: int):
+        """返回附件信息；附件或 Release 已被删除时返回 None"""
+        try:
+            return self.get(f"repos/{repo}/releases/{release_id}/assets/{asset_id}").json()
+        except requests.HTTPError as e:
+            if getattr(e.response, "status_code", None) == 404:
+                return None
+            raise
+
+    def delete_release_asset(self, repo: str, release_id: int, asset_id: int):
+        self.delete(f"repos/{repo}/releases/{release_id}/assets/{asset_id}")
+
+    def upload_release_asset(self, repo: str, release_id: int, file_path: str, filename: str,
+                             content_type: str = "application/octet-stream"):
+        """流式上传附件，返回 (附件信息, 平均吞吐 字节/秒)
+
+        Gitea 不支持断点续传：重试前先核对同名附件，完整则视为成功，残缺则删除后重传。
+        上传的尝试次数沿用 CI_UPLOAD_RETRIES（默认 4），不受 CI_HTTP_RETRIES 影响。
+        """
+        size = os.path.getsize(file_path)
+        path = f"repos/{repo}/releases/{release_id}/assets"
+        attempts = max(1, int(os.getenv("CI_UPLOAD_RETRIES", "4")))
+        with MultipartFileStream("attachment", file_path, filename, content_type) as body:
+            for attempt in range(attempts):
+                body.reset()
+                try:
+                    resp = self.post(path, data=body, headers={"Content-Type": body.content_type},
+                                     timeout=(10, 600), retry=False)
+                    return resp.json(), body.throughput()
+                except (*RETRYABLE_EXCEPTIONS, requests.HTTPError) as e:
+                    status = getattr(getattr(e, "response", None), "status_code", None)
+                    if (status is not None and status < 500) or attempt == attempts - 1:
+                        raise  # 4xx 不会因重试而成功
+                    asset = self._reconcile_asset(repo, release_id, filename, size)
+                    if asset:
+                        return asset, body.throughput()
+                    self._sleep_before_retry(attempt, e)
+
+    def _reconcile_asset(self, repo: str, release_id: int, filename: str, size: int):
+        try:
+            for asset in self.list_release_assets(repo, release_id):
+                if asset.get("name") != filename:
+                    continue
+                if asset.get("size") == size:
+                    print(f"✅ 服务端已存在完整附件 {filename}，无需重传")
+                    return asset
+                self.delete_release_asset(repo, release_id, asset["id"])
+        except requests.RequestException as e:
+            print(f"⚠️ 检查已有附件失败（忽略）: {e}")
+        return None
+
+
+_clients = {}
+
+
+def get_client(api_url: str, token: str) -> GiteaClient:
+    """按 (api_url, token) 复用同一个客户端，整个进程共享连接池"""
+    key = (normalize_api_url(api_url), token)
+    if key not in _clients:
+        _clients[key] = GiteaClient(api_url, token)
+    return _clients[key]
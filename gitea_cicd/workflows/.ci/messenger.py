@@ -1,24 +1,103 @@
 # 通知库
 
+import atexit
 import os
+import queue
+import threading
+import time
 import requests
 
 
 DEFAULT_TOPIC ="169"
 DEFAULT_NTFY_URL=f"http://192.168.0.169:8125/{DEFAULT_TOPIC}"
 
+PRIORITY_ORDER = ["min", "low", "default", "", "high", "max", "urgent"]
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+_session = requests.Session()
+
+
 def send_ntfy(message: str, title: str = None, priority: str = None, tags: str = None):
+    """异步发送 ntfy 通知：只入队，立即返回，不占用流水线关键路径"""
     base_url = os.getenv("NTFY_BASE_URL") or DEFAULT_NTFY_URL
     topic = os.getenv("NTFY_TOPIC") or DEFAULT_TOPIC
-    
+
     if not base_url or not topic:
         print(f"⚠️ ntfy 通知跳过：缺少 NTFY_BASE_URL 或 NTFY_TOPIC 环境变量")
         print(f"通知内容: {title or ''} - {message}")
         return
-    
+
     url = f"{base_url.rstrip('/')}/{topic}"
-    headers = {"Title": title or "", "Priority": priority or "", "Tags": tags or ""}
+    _ensure_worker()
+    _queue.put({"url": url, "message": message, "title": title or "", "priority": priority or "", "tags": tags or ""})
+
+
+def flush(timeout: float = None):
+    """等待队列中的通知发送完毕，最多等待 timeout 秒（默认 NTFY_FLUSH_TIMEOUT，5 秒）"""
+    if timeout is None:
+        timeout = float(os.getenv("NTFY_FLUSH_TIMEOUT", "5"))
+    deadline = time.monotonic() + timeout
+    with _queue.all_tasks_done:
+        while _queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"⚠️ ntfy 仍有 {_queue.unfinished_tasks} 条通知未发出，放弃等待")
+                return False
+            _queue.all_tasks_done.wait(remaining)
+    return True
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="ntfy-sender", daemon=True)
+            _worker.start()
+
+
+def _worker_loop():
+    """后台发送线程：取到一条后在合并窗口内收集突发的其余通知，按目标合并成一条发送"""
+    window = float(os.getenv("NTFY_COALESCE_WINDOW", "0.5"))
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        by_url = {}
+        for item in batch:
+            by_url.setdefault(item["url"], []).append(item)
+        for url, items in by_url.items():
+            _post(url, _coalesce(items))
+        for _ in batch:
+            _queue.task_done()
+
+
+def _coalesce(items: list) -> dict:
+    if len(items) == 1:
+        return items[0]
+    priority = max((i["priority"] for i in items), key=lambda p: PRIORITY_ORDER.index(p) if p in PRIORITY_ORDER else 3)
+    tags = ",".join(dict.fromkeys(t for i in items for t in i["tags"].split(",") if t))
+    message = "\n\n".join(f"【{i['title']}】{i['message']}" if i["title"] else i["message"] for i in items)
+    return {"message": message, "title": f"{items[0]['title'] or '通知'} 等 {len(items)} 条", "priority": priority, "tags": tags}
+
+
+def _post(url: str, item: dict):
+    # 标题等放在查询参数中：HTTP 头只能是 latin-1，中文标题会导致发送失败
+    params = {k: item[k] for k in ("title", "priority", "tags") if item[k]}
     try:
-        requests.post(url, data=message.encode('utf-8'), headers=headers)
+        _session.post(url, data=item["message"].encode('utf-8'), params=params,
+                      timeout=float(os.getenv("NTFY_TIMEOUT", "5")))
     except Exception as e:
         print(f"❌ ntfy 发送失败: {e}")
+
+
+atexit.register(flush)
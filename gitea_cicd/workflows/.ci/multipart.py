@@ -0,0 +1,97 @@
+# 流式 multipart/form-data 编码器：边读文件边发送，内存占用恒定
+
+import os
+import time
+import uuid
+
+
+class MultipartFileStream:
+    """单文件字段的 multipart 请求体，可直接作为 requests 的 data 参数
+
+    提供 __len__ 让 requests 写入 Content-Length（无需 chunked 编码），
+    read() 按需从文件读取并定期打印上传进度与吞吐；reset() 用于重试时从头发送。
+    """
+
+    def __init__(self, field: str, file_path: str, filename: str, content_type: str,
+                 progress_interval: float = 5.0):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        self._tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+        self._file_path = file_path
+        self._filename = filename
+        self._file_size = os.path.getsize(file_path)
+        self._file = None
+        self._progress_interval = progress_interval
+        self.reset()
+
+    def __len__(self):
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def reset(self):
+        """回到请求体开头（重试前调用）"""
+        if self._file:
+            self._file.close()
+        self._file = open(self._file_path, "rb")
+        self._pos = 0
+        self._started = time.monotonic()
+        self._last_report = self._started
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    @property
+    def bytes_sent(self) -> int:
+        return self._pos
+
+    def throughput(self) -> float:
+        """平均吞吐（字节/秒）"""
+        elapsed = time.monotonic() - self._started
+        return self._pos / elapsed if elapsed > 0 else 0.0
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = len(self) - self._pos
+        chunks = []
+        head_len, file_end = len(self._head), len(self._head) + self._file_size
+        while size > 0 and self._pos < len(self):
+            if self._pos < head_len:
+                chunk = self._head[self._pos:self._pos + size]
+            elif self._pos < file_end:
+                chunk = self._file.read(min(size, file_end - self._pos))
+                if not chunk:
+                    raise IOError(f"文件在上传过程中被截断: {self._file_path}")
+            else:
+                offset = self._pos - file_end
+                chunk = self._tail[offset:offset + size]
+            chunks.append(chunk)
+            self._pos += len(chunk)
+            size -= len(chunk)
+        if chunks:
+            self._report_progress()
+        return b"".join(chunks)
+
+    def _report_progress(self):
+        now = time.monotonic()
+        if now - self._last_report < self._progress_interval and self._pos < len(self):
+            return
+        self._last_report = now
+        total = len(self)
+        print(
+            f"📤 {self._filename} 上传进度 {self._pos * 100 / total:5.1f}% "
+            f"({self._pos / 1024 ** 2:.1f}/{total / 1024 ** 2:.1f} MB, "
+            f"{self.throughput() / 1024 ** 2:.2f} MB/s)",
+            flush=True,
+        )
@@ -0,0 +1,323 @@
+# 离线漏洞库：Runner 主机上保存 OSV 格式公告（Pub / Maven）的本地副本，按包名建立 SQLite 索引
+#
+# 刷新（需要网络，建议由 cron/systemd timer 定期执行，例如每天一次）:
+#   python3 .gitea/workflows/.ci/safe.py --refresh
+# 流水线内的扫描只读本地索引，不访问网络；锁文件内容与漏洞库版本均未变化时直接复用上次结论。
+
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+from contextlib import closing
+from cache import cache_dir, file_lock
+
+
+OSV_URL = "https://osv-vulnerabilities.storage.googleapis.com/{ecosystem}/all.zip"
+ECOSYSTEMS = ("Pub", "Maven")
+SEVERITY_ORDER = {"low": 1, "moderate": 2, "medium": 2, "high": 3, "critical": 4, "unknown": 3}
+
+
+def db_path() -> str:
+    return os.path.join(cache_dir("osv"), "osv.sqlite")
+
+
+# ── 刷新 ────────────────────────────────────────────────────────────
+
+def _download(ecosystem: str, dest: str):
+    import requests  # 只有刷新时需要网络依赖
+
+    url = os.getenv("CI_OSV_URL", OSV_URL).format(ecosystem=ecosystem)
+    print(f"⬇️ 下载 {url} ...")
+    with requests.get(url, stream=True, timeout=(10, 300)) as resp:
+        resp.raise_for_status()
+        with open(dest, "wb") as f:
+            for chunk in resp.iter_content(1024 * 1024):
+                f.write(chunk)
+
+
+def _severity(advisory: dict) -> str:
+    label = (advisory.get("database_specific") or {}).get("severity")
+    return (label or "unknown").lower()
+
+
+def refresh(source: str = None) -> str:
+    """下载（或从 source 目录读取 <Ecosystem>.zip）OSV 数据并重建索引，返回新的库版本号
+
+    先在临时文件中建库再原子替换，刷新期间正在运行的扫描不受影响。
+    """
+    workdir = tempfile.mkdtemp(prefix="osv-", dir=cache_dir("osv"))
+    tmp_db = os.path.join(workdir, "osv.sqlite")
+    digest = hashlib.sha256()
+    try:
+        conn = sqlite3.connect(tmp_db)
+        conn.executescript(
+            "CREATE TABLE advisories (id TEXT PRIMARY KEY, summary TEXT, severity TEXT, aliases TEXT, modified TEXT);"
+            "CREATE TABLE affected (ecosystem TEXT, package TEXT, advisory_id TEXT, ranges TEXT, versions TEXT);"
+            "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);"
+        )
+        total = 0
+        for ecosystem in ECOSYSTEMS:
+            archive = os.path.join(source, f"{ecosystem}.zip") if source else os.path.join(workdir, f"{ecosystem}.zip")
+            if not source:
+                _download(ecosystem, archive)
+            with open(archive, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            count = 0
+            with zipfile.ZipFile(archive) as zf:
+                for name in zf.namelist():
+                    if not name.endswith(".json"):
+                        continue
+                    advisory = json.loads(zf.read(name))
+                    if advisory.get("withdrawn"):
+                        continue
+                    conn.execute(
+                        "INSERT OR REPLACE INTO advisories VALUES (?, ?, ?, ?, ?)",
+                        (advisory["id"], advisory.get("summary") or advisory.get("details", "")[:200],
+                         _severity(advisory), json.dumps(advisory.get("aliases", [])), advisory.get("modified")),
+                    )
+                    for affected in advisory.get("affected", []):
+                        package = affected.get("package", {})
+                        if package.get("ecosystem") != ecosystem:
+                            continue
+                        ranges = [r.get("events", []) for r in affected.get("ranges", []) if r.get("type") != "GIT"]
+                        conn.execute(
+                            "INSERT INTO affected VALUES (?, ?, ?, ?, ?)",
+                            (ecosystem, package.get("name"), advisory["id"], json.dumps(ranges),
+                             json.dumps(affected.get("versions", []))),
+                        )
+                    count += 1
+            print(f"📚 {ecosystem}: {count} 条公告")
+            total += count
+
+        version = digest.hexdigest()[:16]
+        conn.execute("CREATE INDEX idx_affected_package ON affected (ecosystem, package)")
+        conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                         [("version", version), ("updated", str(time.time())), ("advisories", str(total))])
+        conn.commit()
+        conn.close()
+        with file_lock(os.path.join(cache_dir("osv"), ".refresh.lock")):
+            os.replace(tmp_db, db_path())
+        print(f"✅ 漏洞库已更新: {total} 条公告，版本 {version}")
+        return version
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ── 版本比较与匹配 ───────────────────────────────────────────────────
+
+_PRERELEASE = {"alpha", "a", "beta", "b", "milestone", "m", "rc", "cr", "snapshot", "dev", "pre", "preview", "ea"}
+
+
+def version_key(version: str):
+    """Pub（semver）与 Maven 版本的近似排序键
+
+    主版本号按数字逐段比较；后缀含 alpha/beta/rc/SNAPSHOT 等视为预发布（小于正式版），
+    其他后缀（如 guava 的 -jre / -android）视为正式版。
+    """
+    version = version.split("+", 1)[0]
+    match = re.match(r"[0-9]+(?:\.[0-9]+)*", version)
+    numbers = [int(n) for n in match.group(0).split(".")] if match else []
+    numbers += [0] * (4 - len(numbers))
+    suffix = version[match.end():] if match else version
+    tokens = re.findall(r"[0-9]+|[A-Za-z]+", suffix.lower())
+    prerelease = any(t in _PRERELEASE for t in tokens if not t.isdigit())
+    rest = tuple((0, int(t), "") if t.isdigit() else (1, 0, t) for t in tokens)
+    return (tuple(numbers), 0 if prerelease else 1, rest if prerelease else ())
+
+
+def is_affected(version: str, ranges: list, versions: list) -> bool:
+    """按 OSV 规范评估 introduced / fixed / last_affected 事件"""
+    if version in versions:
+        return True
+    current = version_key(version)
+    for events in ranges:
+        affected = False
+        for event in sorted(events, key=lambda e: version_key(next(iter(e.values()), "0"))):
+            if "introduced" in event and (event["introduced"] == "0" or current >= version_key(event["introduced"])):
+                affected = True
+            elif "fixed" in event and current >= version_key(event["fixed"]):
+                affected = False
+            elif "last_affected" in event and current > version_key(event["last_affected"]):
+                affected = False
+        if affected:
+            return True
+    return False
+
+
+def _fixed_versions(ranges: list) -> list:
+    return sorted({e["fixed"] for events in ranges for e in events if "fixed" in e}, key=version_key)
+
+
+# ── 锁文件解析 ──────────────────────────────────────────────────────
+
+def parse_pubspec_lock(text: str) -> list:
+    """只取 source: hosted 的包（sdk / git / path 依赖不在 pub.dev 公告范围内）"""
+    packages = []
+    name = version = source = None
+    for line in text.splitlines():
+        if re.match(r"^  [^ ].*:\s*$", line):
+            if name and version and source == "hosted":
+                packages.append(("Pub", name, version))
+            name, version, source = line.strip()[:-1].strip('"'), None, None
+        elif line.startswith("    version:"):
+            version = line.split(":", 1)[1].strip().strip('"')
+        elif line.startswith("    source:"):
+            source = line.split(":", 1)[1].strip()
+        elif line and not line.startswith(" "):
+            if name and version and source == "hosted":
+                packages.append(("Pub", name, version))
+            name = version = source = None
+    if name and version and source == "hosted":
+        packages.append(("Pub", name, version))
+    return packages
+
+
+def parse_gradle_lockfile(text: str) -> list:
+    """group:artifact:version=configurations"""
+    packages = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or line.startswith("empty="):
+            continue
+        coordinate = line.split("=", 1)[0]
+        parts = coordinate.split(":")
+        if len(parts) == 3:
+            packages.append(("Maven", f"{parts[0]}:{parts[1]}", parts[2]))
+    return packages
+
+
+def find_lockfiles() -> list:
+    paths = ["pubspec.lock"] if os.path.exists("pubspec.lock") else []
+    paths += sorted(set(glob.glob(os.path.join("android", "**", "*.lockfile"), recursive=True)))
+    return paths
+
+
+# ── 扫描 ────────────────────────────────────────────────────────────
+
+def _connect_db():
+    """只读打开本地漏洞库；不存在时返回 None"""
+    if not os.path.exists(db_path()):
+        return None
+    return sqlite3.connect(f"file:{db_path()}?mode=ro", uri=True)
+
+
+def db_info() -> dict:
+    conn = _connect_db()
+    if conn is None:
+        return {}
+    with closing(conn):
+        return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+
+def scan_packages(packages: list) -> list:
+    """返回命中的公告 [{ecosystem, package, version, id, severity, summary, aliases, fixed}]"""
+    findings = []
+    with closing(_connect_db()) as conn:
+        for ecosystem, name, version in packages:
+            rows = conn.execute(
+                "SELECT a.advisory_id, a.ranges, a.versions, v.severity, v.summary, v.aliases"
+                " FROM affected a JOIN advisories v ON v.id = a.advisory_id"
+                " WHERE a.ecosystem = ? AND a.package = ?",
+                (ecosystem, name),
+            ).fetchall()
+            for advisory_id, ranges, versions, severity, summary, aliases in rows:
+                ranges = json.loads(ranges)
+                if is_affected(version, ranges, json.loads(versions)):
+                    findings.append({
+                        "ecosystem": ecosystem, "package": name, "version": version, "id": advisory_id,
+                        "severity": severity, "summary": summary, "aliases": json.loads(aliases),
+                        "fixed": _fixed_versions(ranges),
+                    })
+    return findings
+
+
+def _connect_state():
+    conn = sqlite3.connect(os.path.join(cache_dir("osv"), "scans.sqlite"), timeout=10)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS scans ("
+        " repo TEXT, path TEXT, content_hash TEXT, db_version TEXT, findings TEXT, sha TEXT, ts REAL,"
+        " PRIMARY KEY (repo, path))"
+    )
+    return conn
+
+
+def scan_lockfiles(repo: str, sha: str = "") -> tuple:
+    """增量扫描：内容哈希与漏洞库版本都未变的锁文件直接复用上次结论
+
+    返回 (findings, scanned, reused)。
+    """
+    db_version = db_info().get("version")
+    findings, scanned, reused = [], [], []
+    with closing(_connect_state()) as state, state:
+        for path in find_lockfiles():
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            row = state.execute("SELECT content_hash, db_version, findings FROM scans WHERE repo = ? AND path = ?",
+                                (repo, path)).fetchone()
+            if row and row[0] == content_hash and row[1] == db_version:
+                findings.extend(json.loads(row[2]))
+                reused.append(path)
+                continue
+            packages = parse_pubspec_lock(text) if path.endswith("pubspec.lock") else parse_gradle_lockfile(text)
+            result = [dict(f, lockfile=path) for f in scan_packages(packages)]
+            state.execute("INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (repo, path, content_hash, db_version, json.dumps(result, ensure_ascii=False), sha, time.time()))
+            findings.extend(result)
+            scanned.append((path, len(packages)))
+    return findings, scanned, reused
+
+
+def run_scan():
+    """流水线中的安全扫描步骤：只读本地库，超过阈值的公告使步骤失败（ci.ini [safe]）"""
+    import config
+    from alerts import send_alert
+
+    info = db_info()
+    if not info:
+        print("⚠️ Runner 上没有本地漏洞库，跳过扫描（请定期执行 safe.py --refresh）")
+        if config.get_bool("safe", "require_db", False):
+            raise RuntimeError("缺少本地漏洞库")
+        return
+    age_days = (time.time() - float(info.get("updated", 0))) / 86400
+    print(f"📚 本地漏洞库 {info.get('version')}：{info.get('advisories')} 条公告，{age_days:.1f} 天前更新")
+    if age_days > config.get_float("safe", "max_age_days", 7):
+        print("⚠️ 漏洞库已过期，请检查定时刷新任务")
+
+    start = time.monotonic()
+    repo = os.getenv("GITEA_REPO") or "local"
+    findings, scanned, reused = scan_lockfiles(repo, os.getenv("GITEA_SHA", ""))
+    for path, count in scanned:
+        print(f"🔍 扫描 {path}（{count} 个依赖）")
+    for path in reused:
+        print(f"♻️ {path} 与漏洞库均未变化，复用上次结论")
+    if not scanned and not reused:
+        print("⏭️ 未找到 pubspec.lock 或 Gradle 锁文件")
+
+    ignored = set(config.get_list("safe", "ignore"))
+    threshold = SEVERITY_ORDER.get((config.get("safe", "min_severity", "low") or "low").lower(), 1)
+    blocking = []
+    for f in findings:
+        if f["id"] in ignored or ignored.intersection(f["aliases"]):
+            continue
+        fatal = SEVERITY_ORDER.get(f["severity"], 3) >= threshold
+        fix = f"，修复版本 {', '.join(f['fixed'])}" if f["fixed"] else ""
+        line = f"{f['package']} {f['version']}: {f['id']} [{f['severity'].upper()}] {f['summary']}{fix}（{f['lockfile']}）"
+        print(f"{'❌' if fatal else '⚠️'} {line}")
+        if fatal:
+            blocking.append(line)
+    print(f"⏱️ 扫描耗时 {(time.monotonic() - start) * 1000:.0f} ms，发现 {len(findings)} 条公告")
+
+    if blocking:
+        detail = f"依赖存在 {len(blocking)} 个已知漏洞:\n" + "\n".join(blocking[:20])
+        send_alert(detail, title="依赖漏洞")
+        error = RuntimeError(detail)
+        error.ci_alerted = True
+        raise error
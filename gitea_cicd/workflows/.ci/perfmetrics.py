@@ -0,0 +1,232 @@
+# 性能指标：按 ABI 的 APK 大小、Dart AOT 快照（libapp.so）大小、Release 构建耗时与可选的冷启动耗时
+#
+# 每个提交的指标写入 Runner 主机的 SQLite，并与最近一次发布 tag 对应提交的指标比较，
+# 超出 ci.ini [perf] 中的预算时告警或使本步骤失败，在 deploy 发布之前拦住性能回退。
+# 步骤结果缓存回放时（见 pipeline.py on_replay）沿用缓存来源提交的指标，保证每个提交都有记录。
+
+import json
+import os
+import re
+import sqlite3
+import statistics
+import subprocess
+import time
+import zipfile
+from contextlib import closing
+import config
+from alerts import send_alert
+from cache import cache_dir
+from core import build_flutter_artifacts, get_latest_tag, run_command
+from timings import run_context
+
+
+RESULTS_DIR = os.path.join("build", "ci-perf")
+
+# 指标类别 -> 默认允许的增长百分比
+DEFAULT_BUDGETS = {"apk_size": 5.0, "aot_size": 5.0, "build_seconds": 30.0, "startup_ms": 15.0}
+# 默认超预算即失败的类别；其余只警告（耗时类指标受 Runner 负载影响较大）
+DEFAULT_FAIL_ON = ("apk_size", "aot_size")
+
+
+def _connect():
+    conn = sqlite3.connect(os.path.join(cache_dir("perf"), "perf.sqlite"), timeout=10)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS metrics ("
+        " ts REAL, repo TEXT, branch TEXT, sha TEXT, runner TEXT, metric TEXT, value REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_metrics_sha ON metrics (repo, sha, metric)")
+    return conn
+
+
+def measure_artifacts(apks: list) -> dict:
+    """每个按 ABI 拆分的 APK：文件大小与其中 lib/<abi>/libapp.so（Dart AOT 快照）的解压后大小"""
+    metrics = {}
+    for apk in apks:
+        match = re.search(r"app-(.+)-release\.apk$", os.path.basename(apk))
+        abi = match.group(1) if match else "universal"
+        metrics[f"apk_size.{abi}"] = os.path.getsize(apk)
+        with zipfile.ZipFile(apk) as zf:
+            for info in zf.infolist():
+                if info.filename.endswith("/libapp.so"):
+                    metrics[f"aot_size.{info.filename.split('/')[1]}"] = info.file_size
+    return metrics
+
+
+def _application_id() -> str:
+    for name in ("build.gradle", "build.gradle.kts"):
+        path = os.path.join("android", "app", name)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                match = re.search(r"applicationId\s*=?\s*[\"']([^\"']+)[\"']", f.read())
+            if match:
+                return match.group(1)
+    return None
+
+
+def _adb(*args) -> str:
+    return subprocess.run(["adb", *args], capture_output=True, text=True, timeout=120).stdout.strip()
+
+
+def measure_startup(apks: list) -> dict:
+    """在已连接的设备/无头模拟器上测冷启动（am start -W 的 TotalTime，取中位数）；无设备时跳过"""
+    mode = (config.get("perf", "startup", "auto") or "auto").lower()
+    if mode == "off":
+        return {}
+    try:
+        devices = [l for l in _adb("devices").splitlines()[1:] if l.endswith("\tdevice")]
+    except (OSError, subprocess.TimeoutExpired):
+        devices = []
+    if not devices:
+        print("⏭️ 未检测到 adb 设备，跳过启动耗时测试")
+        return {}
+
+    package = _application_id()
+    if not package:
+        print("⚠️ 无法从 android/app/build.gradle 读取 applicationId，跳过启动耗时测试")
+        return {}
+    try:
+        return _measure_on_device(apks, package)
+    except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+        print(f"⚠️ 启动耗时测试失败，跳过该指标: {e}")
+        return {}
+
+
+def _measure_on_device(apks: list, package: str) -> dict:
+    device_abi = _adb("shell", "getprop", "ro.product.cpu.abi")
+    apk = next((a for a in apks if f"-{device_abi}-" in os.path.basename(a)), apks[0])
+    run_command(f"adb install -r {apk}")
+    # 输出最后一行为 包名/Activity；未安装成功或没有启动 Activity 时没有这一行
+    lines = _adb("shell", "cmd", "package", "resolve-activity", "--brief", package).splitlines()
+    activity = lines[-1].strip() if lines else ""
+    if "/" not in activity:
+        print(f"⚠️ 无法解析 {package} 的启动 Activity，跳过启动耗时测试")
+        return {}
+    runs = config.get_int("perf", "startup_runs", 5)
+    samples = []
+    for _ in range(runs):
+        _adb("shell", "am", "force-stop", package)
+        time.sleep(1)
+        match = re.search(r"TotalTime:\s*(\d+)", _adb("shell", "am", "start", "-W", "-n", activity))
+        if match:
+            samples.append(int(match.group(1)))
+    _adb("shell", "am", "force-stop", package)
+    if not samples:
+        print("⚠️ 未能解析 am start -W 输出，跳过启动耗时")
+        return {}
+    print(f"📱 冷启动耗时（{device_abi}，{len(samples)} 次）: {samples} ms")
+    return {"startup_ms": statistics.median(samples)}
+
+
+def record(metrics: dict, sha: str):
+    ctx = run_context()
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM metrics WHERE repo = ? AND sha = ?", (ctx["repo"], sha))
+        conn.executemany(
+            "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(now, ctx["repo"], ctx["branch"], sha, ctx["runner"], name, value) for name, value in metrics.items()],
+        )
+
+
+def replay_metrics(cached: dict):
+    """步骤缓存回放：输入未变化时指标与缓存来源提交相同，复制到当前提交名下"""
+    source, sha = cached.get("sha"), os.getenv("GITEA_SHA")
+    if not source or not sha or source == sha:
+        return
+    ctx = run_context()
+    repo = ctx["repo"]
+    with closing(_connect()) as conn, conn:
+        rows = conn.execute(
+            "SELECT runner, metric, value FROM metrics WHERE repo = ? AND sha = ?", (repo, source)
+        ).fetchall()
+        if not rows:
+            print(f"⚠️ 缓存来源提交 {source[:8]} 没有记录性能指标，本次提交不会有指标")
+            return
+        conn.execute("DELETE FROM metrics WHERE repo = ? AND sha = ?", (repo, sha))
+        conn.executemany(
+            "INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(time.time(), repo, ctx["branch"], sha, runner, metric, value) for runner, metric, value in rows],
+        )
+    print(f"📏 已将提交 {source[:8]} 的 {len(rows)} 项性能指标记到 {sha[:8]} 名下")
+
+
+def baseline(sha: str) -> dict:
+    with closing(_connect()) as conn:
+        return dict(conn.execute(
+            "SELECT metric, value FROM metrics WHERE repo = ? AND sha = ?", (run_context()["repo"], sha)
+        ).fetchall())
+
+
+def compare(metrics: dict, base: dict) -> list:
+    """返回超预算的指标 [(metric, value, base_value, pct, budget, fatal)]"""
+    fail_on = set(config.get_list("perf", "fail_on") or DEFAULT_FAIL_ON)
+    over = []
+    for name, value in metrics.items():
+        kind = name.split(".")[0]
+        base_value = base.get(name)
+        if not base_value:
+            continue
+        budget = config.get_float("perf", kind, DEFAULT_BUDGETS.get(kind, 10.0))
+        pct = (value / base_value - 1) * 100
+        if pct > budget:
+            over.append((name, value, base_value, pct, budget, kind in fail_on))
+    return over
+
+
+def _fmt(name: str, value: float) -> str:
+    kind = name.split(".")[0]
+    if kind.endswith("_size"):
+        return f"{value / 1024 ** 2:.2f} MB"
+    if kind == "build_seconds":
+        return f"{value:.1f}s"
+    return f"{value:.0f} ms"
+
+
+def run_performance():
+    sha = os.getenv("GITEA_SHA") or run_command("git rev-parse HEAD")
+
+    start = time.monotonic()
+    apks = build_flutter_artifacts(split_per_abi=True, aab=False)
+    metrics = {"build_seconds": round(time.monotonic() - start, 1)}
+    metrics.update(measure_artifacts(apks))
+    metrics.update(measure_startup(apks))
+
+    for name, value in sorted(metrics.items()):
+        print(f"📏 {name:<28} {_fmt(name, value)}")
+    try:
+        record(metrics, sha)
+    except sqlite3.Error as e:
+        print(f"⚠️ 性能指标写入失败（忽略）: {e}")
+
+    latest = get_latest_tag()
+    report = {"sha": sha, "metrics": metrics, "baseline": None, "regressions": []}
+    if not latest or not latest[1] or latest[1] == sha:
+        print("ℹ️ 没有可比较的发布版本，仅记录本次指标")
+    else:
+        base = baseline(latest[1])
+        if not base:
+            print(f"ℹ️ {latest[0]}（{latest[1][:8]}）没有记录过性能指标，跳过比较")
+        else:
+            report["baseline"] = {"tag": latest[0], "sha": latest[1], "metrics": base}
+            for name, value in sorted(metrics.items()):
+                if name in base:
+                    print(f"   {name:<28} {_fmt(name, base[name])} → {_fmt(name, value)}"
+                          f"（{(value / base[name] - 1) * 100:+.1f}%）")
+            report["regressions"] = compare(metrics, base)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, "perf.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    fatal = []
+    for name, value, base_value, pct, budget, is_fatal in report["regressions"]:
+        line = f"{name}: {_fmt(name, base_value)} → {_fmt(name, value)}（+{pct:.1f}%，预算 {budget:g}%）"
+        print(f"{'❌' if is_fatal else '⚠️'} 超出性能预算 {line}")
+        if is_fatal:
+            fatal.append(line)
+    if fatal:
+        detail = f"相对 {report['baseline']['tag']} 超出性能预算:\n" + "\n".join(fatal)
+        send_alert(detail, title="性能回退")
+        error = RuntimeError(detail)
+        error.ci_alerted = True
+        raise error
@@ -0,0 +1,9 @@
+from perfmetrics import run_performance
+
+
+def main():
+    run_performance()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+# 流水线编排：按依赖关系（DAG）并行执行各步骤，取代 trigger.yaml 中的顺序循环
+
+import argparse
+import importlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import NamedTuple
+import procs
+import stepcache
+import tracing
+from tracing import span
+
+
+CI_DIR = os.path.dirname(os.path.abspath(__file__))
+# 步骤发现本次运行已被更新的提交取代时使用的退出码（见 supersede.py）
+SUPERSEDED_EXIT_CODE = 75
+
+
+class Step(NamedTuple):
+    name: str
+    script: str          # 相对 .ci 目录的脚本路径
+    deps: tuple = ()     # 依赖的步骤名
+    inputs: tuple = ()   # 影响结果的输入（相对工作区的路径/glob）；声明后启用步骤结果缓存
+    on_replay: str = None  # 回放缓存结果时调用的 "模块:函数"（参数为缓存记录），用于补写步骤的副作用
+
+
+# ── 任务编排：检查 / 安全扫描 / 性能测试互不依赖，可并行 ───────────────
+PIPELINE = [
+    Step("checkout", "checkout.py"),
+    # 代码检查
+    # widget / golden 测试会加载 pubspec 声明的资源；不存在的可选配置文件不参与哈希
+    Step("check", "check.py", ("checkout",),
+         inputs=("lib", "test", "assets", "analysis_options.yaml", "dart_test.yaml", "build.yaml", "l10n.yaml",
+                 "pubspec.yaml", "pubspec.lock")),
+    # 安全/漏洞扫描：结论还取决于本地漏洞库版本，由 osvdb 按锁文件自行增量缓存
+    Step("safe", "safe.py", ("checkout",)),
+    # 性能测试
+    # 回放时把缓存来源提交的指标记到当前提交名下，发布提交（常只改文档）也能作为基线
+    Step("performance", "performance.py", ("checkout",),
+         inputs=("lib", "android", "assets", "pubspec.yaml", "pubspec.lock"),
+         on_replay="perfmetrics:replay_metrics"),
+    Step("deploy", "deploy.py", ("check", "safe", "performance")),  # 部署
+]
+
+# 依赖满足的状态
+DONE = ("success", "skipped", "cached")
+
+
+class _StepOutput:
+    """进程内模式下替换 sys.stdout/stderr：按当前线程所属步骤加前缀并写入该步骤日志"""
+
+    def __init__(self, runner, stream):
+        self._runner = runner
+        self._stream = stream
+        self._local = threading.local()
+
+    def bind(self, step_name: str, log):
+        self._local.step = step_name
+        self._local.log = log
+        self._local.buffer = ""
+
+    @property
+    def step(self):
+        return getattr(self._local, "step", None)
+
+    def unbind(self):
+        if getattr(self._local, "buffer", ""):
+            self.write("\n")
+        self._local.step = None
+
+    def write(self, text: str):
+        step = getattr(self._local, "step", None)
+        if not step:
+            # 非步骤线程（或步骤内部再开的线程）原样输出
+            with self._runner._print_lock:
+                self._stream.write(text)
+            return len(text)
+        self._local.log.write(text)
+        lines = (self._local.buffer + text).split("\n")
+        self._local.buffer = lines.pop()
+        for line in lines:
+            self._runner._log(f"[{step}] {line}", stream=self._stream)
+        return len(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def current_step() -> str:
+    """当前线程正在执行的步骤名（子进程模式下来自 CI_STEP 环境变量）"""
+    # 按属性判断而非 isinstance：以 __main__ 运行时本模块会被步骤再次导入成另一份
+    return getattr(sys.stdout, "step", None) or os.getenv("CI_STEP", "")
+
+
+def default_workers(steps) -> int:
+    """并发上限：CI_PIPELINE_JOBS 优先，否则取 CPU 核数的一半（Flutter/Gradle 本身就吃多核）"""
+    if os.getenv("CI_PIPELINE_JOBS"):
+        return max(1, int(os.getenv("CI_PIPELINE_JOBS")))
+    return max(1, min(len(steps), (os.cpu_count() or 2) // 2))
+
+
+def validate(steps):
+    """检查依赖是否存在、是否有环"""
+    names = {s.name for s in steps}
+    for s in steps:
+        unknown = set(s.deps) - names
+        if unknown:
+            raise ValueError(f"步骤 {s.name} 依赖了不存在的步骤: {', '.join(sorted(unknown))}")
+    remaining = {s.name: set(s.deps) for s in steps}
+    while remaining:
+        ready = [n for n, d in remaining.items() if not d]
+        if not ready:
+            raise ValueError(f"步骤依赖存在环: {', '.join(sorted(remaining))}")
+        for n in ready:
+            del remaining[n]
+        for d in remaining.values():
+            d.difference_update(ready)
+
+
+class PipelineRunner:
+    def __init__(self, steps, max_workers: int = None, log_dir: str = None, in_process: bool = False,
+                 supersede_check=None):
+        validate(steps)
+        self.supersede_check = supersede_check   # 返回更新的 head（已被取代）或 None
+        self.in_process = in_process
+        self.steps = {s.name: s for s in steps}
+        self.order = [s.name for s in steps]
+        self.max_workers = max_workers or default_workers(steps)
+        self.log_dir = log_dir or os.getenv("CI_LOG_DIR") or os.path.join("build", "ci-logs")
+        self.status = {}      # name -> success / cached / failed / skipped / cancelled / superseded
+        self.durations = {}
+        self.elapsed = 0.0
+        self.superseded_by = None
+        self.cached = set()
+        self._procs = {}
+        self._cancelled = threading.Event()
+        self._print_lock = threading.Lock()
+
+    def _log(self, text: str, stream=None):
+        with self._print_lock:
+            stream = stream or sys.__stdout__
+            stream.write(text + "\n")
+            stream.flush()
+
+    def run_step(self, step: Step) -> bool:
+        """以子进程执行单个步骤：输出带前缀实时打印，同时完整写入 <log_dir>/<step>.log"""
+        if self._cancelled.is_set():
+            return False
+        key = None
+        if step.inputs and stepcache.enabled():
+            try:
+                key = stepcache.step_key(os.path.join(CI_DIR, step.script), step.inputs)
+            except OSError as e:
+                self._log(f"⚠️ [{step.name}] 无法计算步骤缓存键，本次不使用缓存: {e}")
+        with span(step.name, cat="step", script=step.script) as trace:
+            cached = None
+            if key:
+                try:
+                    cached = stepcache.lookup(step.name, key)
+                except OSError as e:
+                    self._log(f"⚠️ [{step.name}] 读取步骤缓存失败（忽略）: {e}")
+            if cached:
+                try:
+                    ok = self._replay_step(step, cached)
+                    trace["cached"] = True
+                except OSError as e:
+                    self._log(f"⚠️ [{step.name}] 回放步骤缓存失败，改为实际执行: {e}")
+                    self.cached.discard(step.name)
+                    cached = None
+            if not cached:
+                start = time.monotonic()
+                ok = self._run_step(step)
+                # 只缓存通过的结果；被取消/取代的运行没有有效结论
+                if key and ok and not self._cancelled.is_set() and not self.superseded_by:
+                    # 缓存只是加速手段：缓存目录写满或无权限时保留真实结果
+                    try:
+                        stepcache.store(step.name, key, ok, time.monotonic() - start,
+                                        os.path.join(self.log_dir, f"{step.name}.log"))
+                    except OSError as e:
+                        self._log(f"⚠️ [{step.name}] 写入步骤缓存失败（忽略）: {e}")
+            trace["status"] = "success" if ok else "failed"
+        tracing.flush()
+        return ok
+
+    def _replay_step(self, step: Step, cached: dict) -> bool:
+        """输入未变化：回放缓存的日志与结论，不实际执行"""
+        ok = cached["ok"]
+        source = f"提交 {cached['sha'][:8]} " if cached.get("sha") else "上次运行"
+        self._log(f"♻️ [{step.name}] 输入未变化，复用{source}的结果"
+                  f"（{'通过' if ok else '失败'}，原耗时 {cached.get('duration', 0):.1f}s）")
+        if os.path.isfile(cached["log"]):
+            shutil.copyfile(cached["log"], os.path.join(self.log_dir, f"{step.name}.log"))
+            with open(cached["log"], encoding="utf-8", errors="replace") as log:
+                for line in log:
+                    self._log(f"[{step.name}] {line.rstrip()}")
+        self.durations[step.name] = 0.0
+        if ok:
+            self.cached.add(step.name)
+            if step.on_replay:
+                module_name, _, func = step.on_replay.partition(":")
+                try:
+                    getattr(importlib.import_module(module_name), func)(cached)
+                except Exception as e:
+                    self._log(f"⚠️ [{step.name}] 回放钩子 {step.on_replay} 失败（忽略）: {e}")
+        return ok
+
+    def _run_step(self, step: Step) -> bool:
+        script = os.path.join(CI_DIR, step.script)
+        log_path = os.path.join(self.log_dir, f"{step.name}.log")
+        env = {**os.environ, "CI_STEP": step.name, "PYTHONUNBUFFERED": "1"}
+        start = time.monotonic()
+        self._log(f"▶️ [{step.name}] 开始运行: {step.script}")
+        if self.in_process:
+            returncode = self._run_step_in_process(step, log_path)
+            self.durations[step.name] = time.monotonic() - start
+            self._log(f"{'✅' if returncode == 0 else '❌'} [{step.name}] 结束（进程内，耗时 {self.durations[step.name]:.1f}s）")
+            return self._check_returncode(step, returncode)
+
+        with open(log_path, "w", encoding="utf-8") as log:
+            proc = subprocess.Popen(
+                [sys.executable, script],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                env=env,
+            )
+            self._procs[step.name] = proc
+            if self._cancelled.is_set():
+                proc.terminate()
+            with proc.stdout:
+                for line in proc.stdout:
+                    log.write(line)
+                    self._log(f"[{step.name}] {line.rstrip()}")
+            returncode = proc.wait()
+            self._procs.pop(step.name, None)
+
+        self.durations[step.name] = time.monotonic() - start
+        self._log(f"{'✅' if returncode == 0 else '❌'} [{step.name}] 结束（返回码 {returncode}，耗时 {self.durations[step.name]:.1f}s）")
+        return self._check_returncode(step, returncode)
+
+    def _check_returncode(self, step: Step, returncode: int) -> bool:
+        if returncode == SUPERSEDED_EXIT_CODE:
+            self.superseded_by = self.superseded_by or f"步骤 {step.name} 内部检查"
+        return returncode == 0
+
+    def _run_step_in_process(self, step: Step, log_path: str) -> int:
+        """导入步骤模块并调用其 main()：共享解释器、已导入的库、HTTP 连接池与进程内缓存
+
+        线程无法被强制终止：fail-fast 时终止步骤经 run_command / 测试分片启动的子进程（见 procs.py），
+        步骤随命令失败而结束；纯 Python 的部分会执行到下一条命令为止。
+        """
+        module_name = os.path.splitext(os.path.basename(step.script))[0]
+        with open(log_path, "w", encoding="utf-8") as log:
+            sys.stdout.bind(step.name, log)
+            try:
+                importlib.import_module(module_name).main()
+                return 0
+            except SystemExit as e:
+                return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except Exception:
+                traceback.print_exc(file=sys.stdout)
+                return 1
+            finally:
+                sys.stdout.unbind()
+
+    def cancel(self, reason: str):
+        """fail-fast：不再启动新步骤，并终止所有运行中的步骤"""
+        if self._cancelled.is_set():
+            return
+        self._cancelled.set()
+        self._log(f"🛑 {reason}，取消其余步骤")
+        # 子进程模式：步骤进程收到 SIGTERM 后自行终止其启动的命令（见 procs.py）
+        for proc in list(self._procs.values()):
+            proc.terminate()
+        # 进程内模式：步骤线程启动的命令
+        procs.cancel_all()
+        deadline = time.monotonic() + 10
+        for proc in list(self._procs.values()):
+            try:
+                proc.wait(timeout=max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def run(self) -> bool:
+        os.makedirs(self.log_dir, exist_ok=True)
+        # 子进程继承绝对路径的 trace 目录，各自写入片段，结束时统一合并
+        os.environ["CI_TRACE_DIR"] = os.path.abspath(tracing.trace_dir())
+        tracing.reset()
+        procs.reset()
+        mode = "进程内" if self.in_process else "子进程"
+        self._log(f"🚀 开始执行流水线（{len(self.steps)} 个步骤，{mode}模式，最多并行 {self.max_workers} 个）")
+        if not self.in_process:
+            return self._run_dag()
+
+        # 进程内模式：步骤模块从 .ci 目录导入，stdout/stderr 按线程路由到各步骤日志
+        if CI_DIR not in sys.path:
+            sys.path.insert(0, CI_DIR)
+        saved = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = _StepOutput(self, sys.__stdout__)
+        try:
+            return self._run_dag()
+        finally:
+            sys.stdout, sys.stderr = saved
+
+    def _check_superseded(self) -> bool:
+        """步骤边界检查：分支已有更新的提交时取消本次运行（不算失败）"""
+        if self.superseded_by is None and self.supersede_check:
+            head = self.supersede_check()
+            if head:
+                self.superseded_by = head[:8]
+        if self.superseded_by is not None and not self._cancelled.is_set():
+            self.cancel(f"已被更新的提交取代（{self.superseded_by}）")
+        return self.superseded_by is not None
+
+    def _run_dag(self) -> bool:
+        pending = list(self.order)
+        running = {}
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                ready = [n for n in pending if all(self.status.get(d) in DONE for d in self.steps[n].deps)]
+                if ready and not self._cancelled.is_set():
+                    self._check_superseded()
+                for name in ready:
+                    if self._cancelled.is_set():
+                        break
+                    step = self.steps[name]
+                    pending.remove(name)
+                    if not os.path.exists(os.path.join(CI_DIR, step.script)):
+                        self._log(f"⏭️ [{name}] 跳过不存在的脚本: {step.script}")
+                        self.status[name] = "skipped"
+                        continue
+                    running[pool.submit(self.run_step, step)] = name
+
+                if self._cancelled.is_set():
+                    for name in pending:
+                        self.status[name] = "superseded" if self.superseded_by else "cancelled"
+                    pending.clear()
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        self._log(f"❌ [{name}] 执行异常: {e}")
+                        ok = False
+                    if not ok and self.superseded_by:
+                        self.status[name] = "superseded"
+                        self._check_superseded()
+                    elif self._cancelled.is_set() and not ok:
+                        self.status[name] = "cancelled"
+                    elif ok and name in self.cached:
+                        self.status[name] = "cached"
+                    else:
+                        self.status[name] = "success" if ok else "failed"
+                    if not ok:
+                        self.cancel(f"步骤 {name} 失败")
+
+        self.elapsed = time.monotonic() - started
+        self._summary(self.elapsed)
+        return all(s in DONE + ("superseded",) for s in self.status.values())
+
+    def _summary(self, elapsed: float):
+        if tracing.enabled():
+            self._log(f"📊 耗时追踪: {tracing.merge()}（可在 chrome://tracing 或 ui.perfetto.dev 打开）")
+        icons = {"success": "✅", "cached": "♻️", "failed": "❌", "skipped": "⏭️", "cancelled": "🛑", "superseded": "⏩"}
+        self._log("------------------------------------------")
+        for name in self.order:
+            status = self.status.get(name, "cancelled")
+            duration = f"{self.durations[name]:.1f}s" if name in self.durations else "-"
+            self._log(f"{icons[status]} {name:<12} {status:<10} {duration}")
+        self._log(f"⏱️ 流水线总耗时: {elapsed:.1f}s（日志目录: {self.log_dir}）")
+        if self.superseded_by:
+            self._log(f"⏩ 本次运行已被更新的提交取代（{self.superseded_by}），未完成的步骤已跳过")
+
+
+def _after_run(runner: PipelineRunner, ok: bool):
+    """运行结束后的收尾：记录历史耗时并检查回归、补发被合并的告警摘要（依赖 requests，导入失败时忽略）"""
+    if CI_DIR not in sys.path:
+        sys.path.insert(0, CI_DIR)
+    try:
+        from alerts import flush_alert_summaries
+        from timings import record_run
+    except ImportError as e:
+        print(f"⚠️ 跳过耗时记录与告警汇总: {e}")
+        return
+
+    durations = dict(runner.durations, pipeline=runner.elapsed)
+    statuses = dict(runner.status, pipeline="superseded" if runner.superseded_by else "success" if ok else "failed")
+    try:
+        for step, duration, median, _ in record_run(durations, statuses):
+            print(f"⏱️ 耗时回归: {step} {duration:.0f}s（历史中位数 {median:.0f}s）")
+    except Exception as e:
+        print(f"⚠️ 记录历史耗时失败（忽略）: {e}")
+    flush_alert_summaries()
+
+
+def _supersede_check():
+    """分支 head 检查（依赖 requests，导入失败时不检查）"""
+    if CI_DIR not in sys.path:
+        sys.path.insert(0, CI_DIR)
+    try:
+        from supersede import newer_head
+    except ImportError as e:
+        print(f"⚠️ 跳过过期流水线检查: {e}")
+        return None
+    return newer_head
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按依赖关系并行执行 CI 流水线")
+    parser.add_argument("--jobs", type=int, help="最大并行步骤数（默认按 CPU 核数）")
+    parser.add_argument("--log-dir", help="每个步骤的日志目录（默认 build/ci-logs）")
+    parser.add_argument("--in-process", action="store_true", default=os.getenv("CI_PIPELINE_INPROCESS") == "1",
+                        help="在同一进程内导入并调用各步骤的 main()（也可设置 CI_PIPELINE_INPROCESS=1）")
+    args = parser.parse_args()
+
+    runner = PipelineRunner(PIPELINE, max_workers=args.jobs, log_dir=args.log_dir, in_process=args.in_process,
+                            supersede_check=_supersede_check())
+    ok = runner.run()
+    _after_run(runner, ok)
+    if not ok:
+        sys.exit(1)
+    if runner.superseded_by:
+        return
+    print("✨ 恭喜！所有流程已圆满完成。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# 子进程登记表：fail-fast / 取代取消时靠它终止步骤启动的命令
+#
+# run_command 与测试分片启动的子进程都登记在这里；子进程各自成为进程组组长，
+# 终止时连同 shell 启动的 flutter / gradle 客户端一起结束（已脱离的 Gradle 守护进程不受影响）。
+# - 进程内模式：PipelineRunner.cancel() 直接调用 cancel_all()
+# - 子进程模式：步骤进程（环境变量 CI_STEP）收到 SIGTERM 时先 cancel_all() 再退出
+
+import os
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+
+_lock = threading.Lock()
+_procs = set()
+_cancelled = threading.Event()
+
+
+def popen(*args, **kwargs) -> subprocess.Popen:
+    """启动子进程（独立进程组），取消后再启动的命令会被立即终止"""
+    return subprocess.Popen(*args, start_new_session=True, **kwargs)
+
+
+@contextmanager
+def track(proc: subprocess.Popen):
+    with _lock:
+        _procs.add(proc)
+    if _cancelled.is_set():
+        terminate(proc)
+    try:
+        yield proc
+    finally:
+        with _lock:
+            _procs.discard(proc)
+
+
+def terminate(proc: subprocess.Popen, sig=signal.SIGTERM):
+    """向子进程所在进程组发送信号（连同 flutter_tester、gradle 客户端等孙进程）"""
+    if proc.poll() is not None:
+        return
+    try:
+        os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        proc.send_signal(sig)
+
+
+def cancel_all(timeout: float = 10.0):
+    """终止所有登记的子进程，超时后强制 kill；之后新登记的进程同样会被终止"""
+    _cancelled.set()
+    with _lock:
+        procs = list(_procs)
+    for proc in procs:
+        terminate(proc)
+    deadline = time.monotonic() + timeout
+    for proc in procs:
+        try:
+            proc.wait(timeout=max(0.1, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            terminate(proc, signal.SIGKILL)
+
+
+def cancelled() -> bool:
+    return _cancelled.is_set()
+
+
+def reset():
+    _cancelled.clear()
+
+
+def _on_sigterm(signum, frame):
+    cancel_all(timeout=5)
+    raise SystemExit(128 + signum)
+
+
+# 子进程模式的步骤进程：命令在独立进程组中，对步骤进程的 terminate() 到不了它们
+if os.getenv("CI_STEP") and threading.current_thread() is threading.main_thread():
+    signal.signal(signal.SIGTERM, _on_sigterm)
@@ -0,0 +1,19 @@
+import argparse
+from osvdb import refresh, run_scan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="依赖漏洞扫描（离线 OSV 库）")
+    parser.add_argument("--refresh", action="store_true", help="下载 OSV 数据并重建本地索引（需要网络）")
+    parser.add_argument("--source", help="从目录中的 Pub.zip / Maven.zip 导入，而不是下载")
+    # 进程内模式下 sys.argv 属于 pipeline.py，忽略不认识的参数
+    args, _ = parser.parse_known_args()
+
+    if args.refresh:
+        refresh(args.source)
+    else:
+        run_scan()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# 步骤结果缓存：步骤声明输入路径（glob），输入、.ci 代码与工具链均未变化时直接回放上次通过的结果与日志
+#
+# 只缓存通过的结果：失败可能来自网络、磁盘等基础设施问题，下次应重新执行。
+# 结果保存在 Runner 主机的 CI_CACHE_ROOT/steps/<仓库>/<步骤>/<哈希>/ 下，每个步骤保留最近 CI_STEPS_KEEP 条。
+
+import glob
+import json
+import os
+import shutil
+import time
+import config
+from cache import cache_dir, file_lock, hash_inputs
+
+
+def enabled() -> bool:
+    return config.get_bool("steps", "cache", True)
+
+
+def _toolchain() -> list:
+    """Flutter SDK 位置与版本文件：升级 SDK 后分析/测试结果可能不同"""
+    flutter = shutil.which("flutter")
+    if not flutter:
+        return ["flutter:none"]
+    root = os.path.dirname(os.path.dirname(os.path.realpath(flutter)))
+    parts = [f"flutter:{root}"]
+    for name in (os.path.join("bin", "cache", "flutter.version.json"), "version"):
+        path = os.path.join(root, name)
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                parts.append(f.read())
+    return parts
+
+
+def step_key(script: str, inputs) -> str:
+    """输入文件内容 + 步骤脚本 + .ci 下全部模块与 ci.ini + 工具链 的哈希
+
+    步骤脚本只是薄封装，实际逻辑在 core / testshards / perfmetrics 等模块中，因此整个 .ci 目录都计入。
+    """
+    paths = set()
+    for pattern in inputs:
+        paths.update(glob.glob(pattern, recursive=True))
+    ci_dir = os.path.dirname(os.path.abspath(__file__))
+    extra = [os.getenv("CI_STEPS_CACHE_SALT", ""), *_toolchain()]
+    ci_files = sorted(glob.glob(os.path.join(ci_dir, "*.py"))) + [os.path.join(ci_dir, "ci.ini")]
+    for path in (script, *ci_files):
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                extra.append(f.read())
+    return hash_inputs(paths, extra=extra)[:32]
+
+
+def _step_dir(step: str) -> str:
+    repo = (os.getenv("GITEA_REPO") or "local").replace("/", "__")
+    return cache_dir("steps", repo, step)
+
+
+def lookup(step: str, key: str):
+    """命中时返回 {ok, duration, sha, ts, log}，log 为缓存的日志路径"""
+    entry = os.path.join(_step_dir(step), key)
+    try:
+        with open(os.path.join(entry, "result.json"), encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not result.get("ok"):
+        return None
+    os.utime(entry, None)
+    result["log"] = os.path.join(entry, "step.log")
+    return result
+
+
+def store(step: str, key: str, ok: bool, duration: float, log_path: str):
+    root = _step_dir(step)
+    entry = os.path.join(root, key)
+    tmp = f"{entry}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    if os.path.isfile(log_path):
+        shutil.copyfile(log_path, os.path.join(tmp, "step.log"))
+    with open(os.path.join(tmp, "result.json"), "w", encoding="utf-8") as f:
+        json.dump({"ok": ok, "duration": duration, "sha": os.getenv("GITEA_SHA", ""), "ts": time.time()}, f)
+    with file_lock(os.path.join(root, ".lock")):
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(tmp, entry)
+        _prune(root, config.get_int("steps", "keep", 20))
+
+
+def _prune(root: str, keep: int):
+    entries = sorted(
+        (os.path.join(root, name) for name in os.listdir(root) if not name.startswith(".") and ".tmp-" not in name),
+        key=os.path.getmtime, reverse=True,
+    )
+    for path in entries[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
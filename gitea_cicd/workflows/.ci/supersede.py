@@ -0,0 +1,42 @@
+# 取代过期流水线：连续推送时，只有分支最新提交的那次运行需要走完构建与发布
+#
+# 在步骤边界用一次轻量的 Gitea API 调用比较 GITEA_SHA 与分支当前 head，
+# 不一致说明已有更新的提交排队，本次运行以 SUPERSEDED_EXIT_CODE 干净退出（流水线整体视为成功）。
+
+import os
+import sys
+from urllib.parse import quote
+import requests
+import config
+from gitea_client import get_client
+from pipeline import SUPERSEDED_EXIT_CODE
+
+
+def newer_head():
+    """分支 head 已不是本次运行的提交时返回新 head，否则（或无法判断时）返回 None"""
+    if not config.get_bool("supersede", "enabled", True):
+        return None
+    sha = os.getenv("GITEA_SHA")
+    branch = os.getenv("GITEA_REF_NAME")
+    repo = os.getenv("GITEA_REPO")
+    token = os.getenv("GITEA_TOKEN")
+    api_url = os.getenv("GITEA_API_URL")
+    if not all([sha, branch, repo, token, api_url]):
+        return None
+    try:
+        resp = get_client(api_url, token).get(f"repos/{repo}/branches/{quote(branch, safe='/')}",
+                                              timeout=(3, 5), retry=False)
+        head = resp.json()["commit"]["id"]
+    except (requests.RequestException, KeyError, TypeError, ValueError) as e:
+        print(f"⚠️ 查询分支 {branch} 最新提交失败，继续运行: {e}")
+        return None
+    return head if head and head != sha else None
+
+
+def exit_if_superseded():
+    """步骤内部的检查点（如部署前）：已被取代时以 SUPERSEDED_EXIT_CODE 退出"""
+    head = newer_head()
+    if head:
+        print(f"⏩ 分支 {os.getenv('GITEA_REF_NAME')} 已有更新的提交 {head[:8]}，"
+              f"本次运行（{os.getenv('GITEA_SHA', '')[:8]}）被取代，跳过后续工作")
+        sys.exit(SUPERSEDED_EXIT_CODE)
@@ -0,0 +1,195 @@
+# 分片并行的 flutter test：按 CPU/内存决定分片数，各分片以 --machine 输出 JSON 事件，汇总后快速失败
+#
+# flutter pub get 只执行一次；各分片以 --no-pub 启动并设置 FLUTTER_ALREADY_LOCKED，避免争抢 SDK 启动锁。
+
+import glob
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from contextlib import ExitStack
+import config
+import procs
+from alerts import send_alert
+from buildcache import flutter_build_cache
+from core import get_flutter_version, run_command
+from tracing import span
+
+
+RESULTS_DIR = os.path.join("build", "ci-test")
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _available_memory_gb() -> float:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable"):
+                    return int(line.split()[1]) / 1024 ** 2
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+
+def shard_count(test_files: int) -> int:
+    """CI_TEST_SHARDS 优先；否则取 min(CPU 核数, 可用内存 / 每分片内存, 测试文件数)"""
+    override = config.get_int("test", "shards")
+    if override:
+        return max(1, override)
+    per_shard_gb = config.get_float("test", "shard_memory_gb", 1.5)
+    by_memory = int(_available_memory_gb() / per_shard_gb) or 1
+    return max(1, min(_cpu_count(), by_memory, test_files))
+
+
+class _ShardResults:
+    """按分片汇总 --machine 事件（各分片的 test id 互相独立，以 (shard, id) 为键）"""
+
+    def __init__(self):
+        self.suites = {}
+        self.tests = {}
+        self.errors = {}
+        self.passed = 0
+        self.skipped = 0
+        self.failures = []
+
+    def handle(self, shard: int, event: dict):
+        """处理一条事件，出现失败时返回该失败记录"""
+        kind = event.get("type")
+        if kind == "suite":
+            self.suites[(shard, event["suite"]["id"])] = event["suite"].get("path")
+        elif kind == "testStart":
+            test = event["test"]
+            self.tests[(shard, test["id"])] = test
+        elif kind == "error":
+            self.errors.setdefault((shard, event["testID"]), []).append(
+                f"{event.get('error', '')}\n{event.get('stackTrace', '')}".strip())
+        elif kind == "testDone":
+            key = (shard, event["testID"])
+            test = self.tests.get(key, {})
+            if event.get("result") != "success":
+                # 加载失败（编译错误等）以隐藏测试的形式上报，同样计为失败
+                failure = {
+                    "shard": shard,
+                    "name": test.get("name", "?"),
+                    "suite": self.suites.get((shard, test.get("suiteID"))),
+                    "result": event.get("result"),
+                    "errors": self.errors.get(key, []),
+                }
+                self.failures.append(failure)
+                return failure
+            if event.get("skipped"):
+                self.skipped += 1
+            elif not event.get("hidden"):
+                self.passed += 1
+        return None
+
+
+def _read_shard(shard: int, proc, events: queue.Queue, jsonl_path: str):
+    """读取分片的 stdout：原样落盘，同时把 JSON 事件交给主线程（非 JSON 行忽略）
+
+    无论是否出错都会放入结束标记，否则主线程会一直等待该分片。
+    """
+    try:
+        with open(jsonl_path, "w", encoding="utf-8") as out, proc.stdout:
+            for line in proc.stdout:
+                out.write(line)
+                if line.startswith("{"):
+                    try:
+                        events.put((shard, json.loads(line)))
+                    except ValueError:
+                        pass
+    finally:
+        # 读取中断时关闭管道，分片进程不会因写满管道而卡住
+        proc.stdout.close()
+        events.put((shard, None))
+
+
+def run_sharded_tests():
+    test_files = glob.glob(os.path.join("test", "**", "*_test.dart"), recursive=True)
+    if not test_files:
+        print("⏭️ 未找到 test/**/*_test.dart，跳过测试")
+        return
+
+    shards = shard_count(len(test_files))
+    fail_fast = config.get_bool("test", "fail_fast", True)
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    print(f"🧪 {len(test_files)} 个测试文件，分 {shards} 片并行执行（CPU {_cpu_count()} 核，"
+          f"可用内存 {_available_memory_gb():.1f} GB）")
+
+    start = time.monotonic()
+    with flutter_build_cache(get_flutter_version()) as cache_env:
+        run_command("flutter pub get", env=cache_env)
+        env = {**os.environ, **cache_env, "FLUTTER_ALREADY_LOCKED": "true"}
+
+        events = queue.Queue()
+        shard_procs = []
+        stack = ExitStack()
+        for index in range(shards):
+            command = ["flutter", "test", "--machine", "--no-pub",
+                       f"--total-shards={shards}", f"--shard-index={index}"]
+            stderr = open(os.path.join(RESULTS_DIR, f"shard-{index}.log"), "w", encoding="utf-8")
+            proc = procs.popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True,
+                               encoding="utf-8", errors="replace", env=env)
+            stderr.close()
+            shard_procs.append(proc)
+            stack.enter_context(procs.track(proc))
+            threading.Thread(target=_read_shard, daemon=True, name=f"test-shard-{index}",
+                             args=(index, proc, events, os.path.join(RESULTS_DIR, f"shard-{index}.jsonl"))).start()
+
+        results = _ShardResults()
+        aborted = False
+        with span(f"flutter test x{shards}", cat="command", shards=shards) as trace:
+            remaining = shards
+            while remaining:
+                shard, event = events.get()
+                if event is None:
+                    remaining -= 1
+                    continue
+                failure = results.handle(shard, event)
+                if failure:
+                    print(f"❌ [分片 {shard}] {failure['name']}（{failure['suite'] or '-'}）")
+                    if fail_fast and not aborted:
+                        aborted = True
+                        print("🛑 快速失败：终止其余分片")
+                        # 终止整个进程组：flutter 启动的 flutter_tester 也要一起结束
+                        for proc in shard_procs:
+                            procs.terminate(proc)
+            returncodes = [proc.wait() for proc in shard_procs]
+            stack.close()
+            trace.update(passed=results.passed, failed=len(results.failures), skipped=results.skipped)
+
+    elapsed = time.monotonic() - start
+    summary = {
+        "shards": shards,
+        "passed": results.passed,
+        "failed": len(results.failures),
+        "skipped": results.skipped,
+        "aborted": aborted,
+        "returncodes": returncodes,
+        "seconds": round(elapsed, 1),
+        "failures": results.failures,
+    }
+    with open(os.path.join(RESULTS_DIR, "results.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"📊 测试结果: 通过 {results.passed}，失败 {len(results.failures)}，跳过 {results.skipped}"
+          f"（{shards} 片，耗时 {elapsed:.1f}s，明细见 {RESULTS_DIR}/results.json）")
+
+    broken = [i for i, code in enumerate(returncodes) if code != 0 and not aborted]
+    if results.failures or broken:
+        detail = "\n\n".join(
+            f"• {f['name']}（{f['suite'] or '-'}）\n" + "\n".join(e[:1500] for e in f["errors"][:2])
+            for f in results.failures[:5]
+        ) or "分片异常退出（返回码 " + ", ".join(str(returncodes[i]) for i in broken) + f"），日志见 {RESULTS_DIR}/shard-*.log"
+        print(detail)
+        send_alert(detail, title=f"测试失败（{len(results.failures)} 个）")
+        error = RuntimeError(f"flutter test 失败: {len(results.failures)} 个用例未通过")
+        error.ci_alerted = True
+        raise error
@@ -0,0 +1,76 @@
+# 历史耗时库：每次运行的步骤耗时写入 Runner 主机上的 SQLite，并与滚动中位数/p90 比较发现回归
+
+import os
+import socket
+import sqlite3
+import statistics
+import time
+from contextlib import closing
+from cache import cache_dir
+from messenger import send_ntfy
+
+
+def _connect():
+    path = os.getenv("CI_TIMINGS_DB") or os.path.join(cache_dir("timings"), "timings.sqlite")
+    conn = sqlite3.connect(path, timeout=10)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS step_timings ("
+        " ts REAL, repo TEXT, branch TEXT, step TEXT, runner TEXT,"
+        " duration REAL, status TEXT, sha TEXT, run_number TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_step_timings_key ON step_timings (repo, branch, step, runner, ts)")
+    return conn
+
+
+def run_context() -> dict:
+    return {
+        "repo": os.getenv("GITEA_REPO") or "local",
+        "branch": os.getenv("GITEA_REF_NAME") or "main",
+        "runner": os.getenv("CI_RUNNER_LABEL") or socket.gethostname(),
+        "sha": os.getenv("GITEA_SHA", ""),
+        "run_number": os.getenv("GITEA_RUN_NUMBER", ""),
+    }
+
+
+def record_run(durations: dict, statuses: dict) -> list:
+    """写入本次运行各步骤耗时，返回检测到的回归列表 [(step, duration, median, p90)]"""
+    ctx = run_context()
+    now = time.time()
+    window = int(os.getenv("CI_TIMING_WINDOW", "20"))
+    min_samples = int(os.getenv("CI_TIMING_MIN_SAMPLES", "5"))
+    threshold = float(os.getenv("CI_TIMING_REGRESSION_PCT", "20")) / 100
+    min_delta = float(os.getenv("CI_TIMING_MIN_DELTA", "30"))
+
+    regressions = []
+    with closing(_connect()) as conn, conn:
+        for step, duration in durations.items():
+            status = statuses.get(step, "")
+            if status == "success":
+                history = [r[0] for r in conn.execute(
+                    "SELECT duration FROM step_timings"
+                    " WHERE repo = ? AND branch = ? AND step = ? AND runner = ? AND status = 'success'"
+                    " ORDER BY ts DESC LIMIT ?",
+                    (ctx["repo"], ctx["branch"], step, ctx["runner"], window),
+                )]
+                if len(history) >= min_samples:
+                    median = statistics.median(history)
+                    p90 = statistics.quantiles(history, n=10)[-1]
+                    if duration > p90 * (1 + threshold) and duration - median > min_delta:
+                        regressions.append((step, duration, median, p90))
+            conn.execute(
+                "INSERT INTO step_timings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, ctx["repo"], ctx["branch"], step, ctx["runner"], duration, status, ctx["sha"], ctx["run_number"]),
+            )
+
+    if regressions:
+        lines = [
+            f"• {step}: {duration:.0f}s（中位数 {median:.0f}s，p90 {p90:.0f}s，+{duration - median:.0f}s / +{(duration / median - 1) * 100:.0f}%）"
+            for step, duration, median, p90 in regressions
+        ]
+        send_ntfy(
+            f"{ctx['repo']}@{ctx['branch']}（Runner {ctx['runner']}，提交 {ctx['sha'][:8] or '-'}）步骤耗时回归:\n" + "\n".join(lines),
+            title="⏱️ CI 耗时回归",
+            priority="high",
+            tags="hourglass",
+        )
+    return regressions
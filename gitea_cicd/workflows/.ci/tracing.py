@@ -0,0 +1,128 @@
+# 耗时追踪：记录命令 / HTTP 请求 / 流水线步骤的 span，输出 Chrome Trace 格式
+#
+# 每个进程把自己的事件写入 <trace_dir>/trace-<pid>.json，流水线结束时合并为 ci-trace.json，
+# 可直接在 chrome://tracing 或 https://ui.perfetto.dev 打开。CI_TRACE=0 关闭。
+
+import atexit
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+_events = []
+_lock = threading.Lock()
+
+# 日志/追踪中需要隐去的凭据：URL 中的 user:token@ 以及 token=xxx 形式的参数
+_SECRET_PATTERNS = [
+    (re.compile(r"(://)[^/@\s\"]+@"), r"\1***@"),
+    (re.compile(r"(?i)\b(token|password|passwd|secret)=([^&\s'\"]+)"), r"\1=***"),
+]
+
+
+def redact(text: str) -> str:
+    """隐去命令、输出中的凭据（Job Token 会出现在 origin 的 URL 里）"""
+    if not text:
+        return text
+    for pattern, repl in _SECRET_PATTERNS:
+        text = pattern.sub(repl, text)
+    token = os.getenv("GITEA_TOKEN")
+    if token and len(token) >= 8:
+        text = text.replace(token, "***")
+    return text
+
+
+def enabled() -> bool:
+    return os.getenv("CI_TRACE", "1") != "0"
+
+
+def trace_dir() -> str:
+    return os.getenv("CI_TRACE_DIR") or os.path.join("build", "ci-trace")
+
+
+@contextmanager
+def span(name: str, cat: str = "ci", **args):
+    """记录一段耗时；产出的 dict 可在块内补充 exit_code / bytes 等参数
+
+    name 与字符串参数在写入前 redact；调用方如需截断 name，应先 redact 再截断。
+    """
+    name = redact(name)
+    if not enabled():
+        yield args
+        return
+    ts = time.time() * 1e6  # 墙钟时间，便于多个进程的事件对齐
+    start = time.perf_counter()
+    try:
+        yield args
+    except BaseException as e:
+        args.setdefault("error", redact(f"{type(e).__name__}: {e}")[:500])
+        raise
+    finally:
+        # trace 可能作为 Release 附件公开，字符串参数一律先 redact
+        args.update({k: redact(v) for k, v in args.items() if isinstance(v, str)})
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": ts,
+            "dur": (time.perf_counter() - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with _lock:
+            _events.append(event)
+
+
+def _metadata() -> list:
+    pid = os.getpid()
+    meta = [{"name": "process_name", "ph": "M", "pid": pid,
+             "args": {"name": f"{os.getenv('CI_STEP') or os.path.basename(sys.argv[0])} ({pid})"}}]
+    for thread in threading.enumerate():
+        meta.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread.ident,
+                     "args": {"name": thread.name}})
+    return meta
+
+
+def flush():
+    """把本进程的事件写入 trace 片段文件（覆盖写，可多次调用）"""
+    if not enabled():
+        return
+    with _lock:
+        events = list(_events)
+    if not events:
+        return
+    os.makedirs(trace_dir(), exist_ok=True)
+    path = os.path.join(trace_dir(), f"trace-{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_metadata() + events, f, ensure_ascii=False, default=str)
+    os.replace(tmp, path)
+
+
+def reset():
+    """流水线开始时清理上一次运行留下的片段"""
+    for path in glob.glob(os.path.join(trace_dir(), "trace-*.json")):
+        os.remove(path)
+
+
+def merge(output: str = None) -> str:
+    """合并所有进程的片段为一个 Chrome Trace 文件，返回文件路径"""
+    flush()
+    output = output or os.path.join(trace_dir(), "ci-trace.json")
+    events = []
+    for path in sorted(glob.glob(os.path.join(trace_dir(), "trace-*.json"))):
+        with open(path, encoding="utf-8") as f:
+            events.extend(json.load(f))
+    # 再整体 redact 一次，覆盖旧版本写下的片段
+    text = redact(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False, default=str))
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(text)
+    return output
+
+
+atexit.register(flush)
@@ -5,6 +5,7 @@ Gitea Runner 物理机专用安装脚本 - 2026年1月修复版（ROOT专用版
 仅适用于内部可信环境！
 """
 
+import json
 import subprocess
 import sys
 import os
@@ -358,10 +359,133 @@ WantedBy=multi-user.target
         run("journalctl -u gitea-runner.service -n 20 --no-pager", check=False, shell=True)
 
 
+def install_gradle_warm_daemon():
+    """安装常驻预热的 Gradle 守护进程服务，连续构建跳过 JVM/Gradle 冷启动
+
+    - ~/.gradle/gradle.properties：按主机内存/CPU 设置 JVM 参数、并行数与空闲退出时间
+    - gradle-warm.service：在预热工程上以 --foreground 常驻运行守护进程（MemoryMax 限制内存上限），
+      空闲超时退出后由 systemd 重新拉起，CI 构建始终有可连接的守护进程
+    - 写入标记文件（含预热工程的 Gradle 发行版），CI 构建在版本一致时使用同一 GRADLE_USER_HOME 以复用守护进程
+    """
+    rprint("="*60, emoji="═")
+    rprint("步骤 4 : 安装 Gradle 常驻预热服务", style="bold blue")
+    rprint("="*60, emoji="═")
+
+    if input("是否安装 Gradle 常驻预热服务？(Y/n): ").strip().lower() == 'n':
+        rprint("跳过 Gradle 预热服务")
+        return True
+
+    gradle_home = "/root/.gradle"
+    warm_dir = "/var/lib/ci-gradle-warm"
+    flutter_bin = "/opt/flutter/bin/flutter"
+
+    # 按主机资源计算：堆取内存的 1/4（1.5G~8G），cgroup 上限再留出元空间、Kotlin 守护进程的余量
+    mem_mb = 4096
+    try:
+        with open("/proc/meminfo") as f:
+            mem_mb = int(next(l for l in f if l.startswith("MemTotal")).split()[1]) // 1024
+    except (OSError, StopIteration, ValueError):
+        rprint("读取内存大小失败，按 4G 计算", style="yellow")
+    heap_mb = max(1536, min(8192, mem_mb // 4))
+    memory_max_mb = min(mem_mb * 3 // 4, heap_mb * 2 + 2048)
+    workers = os.cpu_count() or 4
+    idle_hours = float(input("守护进程空闲多少小时后退出 (默认 3): ").strip() or "3")
+    idle_ms = int(idle_hours * 3600 * 1000)
+    jvmargs = f"-Xmx{heap_mb}m -XX:MaxMetaspaceSize=1g -XX:+UseParallelGC -XX:+HeapDumpOnOutOfMemoryError -Dfile.encoding=UTF-8"
+
+    settings = {
+        "org.gradle.daemon": "true",
+        "org.gradle.jvmargs": jvmargs,
+        "org.gradle.daemon.idletimeout": str(idle_ms),
+        "org.gradle.parallel": "true",
+        "org.gradle.caching": "true",
+        "org.gradle.workers.max": str(workers),
+    }
+    os.makedirs(gradle_home, exist_ok=True)
+    props_file = Path(gradle_home) / "gradle.properties"
+    kept = []
+    if props_file.exists():
+        kept = [l for l in props_file.read_text().splitlines()
+                if l.split("=", 1)[0].strip() not in settings and not l.startswith("# CI 预热守护进程")]
+    props_file.write_text("\n".join(kept + [f"# CI 预热守护进程 - {time.strftime('%Y-%m-%d')}"]
+                                     + [f"{k}={v}" for k, v in settings.items()]) + "\n")
+    rprint(f"已写入 {props_file}（堆 {heap_mb}M，并行 {workers}，空闲 {idle_hours:g} 小时退出）", emoji="✅")
+
+    # 预热工程：用 Flutter 模板生成，Gradle/AGP 版本与新建项目一致
+    app_dir = f"{warm_dir}/app"
+    if not os.path.exists(f"{app_dir}/android"):
+        run(f"mkdir -p {warm_dir}")
+        run(f"{flutter_bin} create --platforms android --project-name ci_gradle_warm {app_dir}", "生成预热工程")
+
+    # 守护进程只服务同一 Gradle 版本的构建，记录预热工程使用的发行版供 CI 比对
+    distribution_url = ""
+    wrapper_props = Path(app_dir) / "android" / "gradle" / "wrapper" / "gradle-wrapper.properties"
+    if wrapper_props.exists():
+        for line in wrapper_props.read_text().splitlines():
+            if line.strip().startswith("distributionUrl="):
+                distribution_url = line.split("=", 1)[1].strip().replace("\\:", ":")
+    if not distribution_url:
+        rprint(f"未能从 {wrapper_props} 读取 distributionUrl，CI 构建将不会复用预热守护进程", style="yellow")
+
+    java_home = ""
+    jh_cmd = run("readlink -f $(which java) | sed 's:/bin/java::'", shell=True, check=False)
+    if jh_cmd:
+        java_home = jh_cmd.stdout.strip()
+
+    # 守护进程以前台方式作为服务主进程运行，始终位于本服务的 cgroup 中、受 MemoryMax 约束；
+    # 空闲超时（org.gradle.daemon.idletimeout）退出后 Restart=always 重新拉起，避免 CI 构建自行启动守护进程
+    service = f"""[Unit]
+Description=Warm Gradle daemon for Flutter CI builds
+After=network-online.target
+
+[Service]
+Type=simple
+User=root
+Group=root
+WorkingDirectory={app_dir}/android
+# 生成 local.properties 等 Gradle 配置（旧版 Flutter 不支持 --config-only 时忽略）
+ExecStartPre=-{flutter_bin} build apk --config-only
+ExecStart={app_dir}/android/gradlew --foreground
+Restart=always
+RestartSec=10
+TimeoutStartSec=1800
+MemoryMax={memory_max_mb}M
+Environment="PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin:/opt/flutter/bin"
+Environment="JAVA_HOME={java_home}"
+Environment="FLUTTER_ROOT=/opt/flutter"
+Environment="GRADLE_USER_HOME={gradle_home}"
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+    svc_file = "/etc/systemd/system/gradle-warm.service"
+    with open(svc_file, "w") as f:
+        f.write(service)
+
+    # CI 构建（buildcache.py）检测该标记：不再为 GRADLE_USER_HOME 单独分桶，直接连接预热的守护进程
+    marker = {
+        "service": "gradle-warm.service",
+        "gradle_user_home": gradle_home,
+        "jvmargs": jvmargs,
+        "idle_timeout_ms": idle_ms,
+        "memory_max_mb": memory_max_mb,
+        "distribution_url": distribution_url,
+    }
+    with open(f"{gradle_home}/ci-warm-daemon.json", "w") as f:
+        json.dump(marker, f, ensure_ascii=False, indent=2)
+
+    run("systemctl daemon-reload")
+    run("systemctl enable gradle-warm.service")
+    run("systemctl restart --no-block gradle-warm.service", "后台启动预热守护进程（首次需下载 Gradle，可能需要数分钟）")
+    rprint(f"Gradle 预热服务已安装（内存上限 {memory_max_mb}M）", emoji="✅")
+    return True
+
+
 def main():
     rprint("Gitea Runner 物理机专用安装脚本（ROOT专用版）".center(60), style="bold magenta")
     rprint("⚠️  警告：此脚本使用 root 用户运行，仅适用于内部可信环境！".center(60), style="bold yellow")
-    rprint("OpenJDK 17  +  Flutter  +  act_runner".center(60), style="dim")
+    rprint("OpenJDK 17  +  Flutter  +  act_runner  +  Gradle 预热".center(60), style="dim")
     print()
 
     rprint("⚠️  重要警告：此配置仅适用于内部可信环境！", style="bold yellow", emoji="⚠️")
@@ -381,11 +505,13 @@ def main():
         install_openjdk17()
         install_flutter()
         install_act_runner()
+        install_gradle_warm_daemon()
         rprint("安装流程执行完毕！", style="bold green", emoji="🎉")
         rprint("请重启 shell 或执行 'source /etc/profile' 更新环境变量", style="bold cyan")
         print()
         rprint("服务状态检查：systemctl status gitea-runner.service", style="dim")
         rprint("日志查看：journalctl -u gitea-runner.service -f", style="dim")
+        rprint("预热服务：systemctl status gradle-warm.service", style="dim")
     except Exception as e:
         rprint(f"安装过程中发生严重错误: {e}", style="bold red")
         sys.exit(1)